@@ -0,0 +1,115 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, FrozenSet, Optional, Tuple
+
+from telegram import Bot, Chat
+from telegram.constants import ChatMemberStatus, ChatType
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Admin lists older than this are refreshed before use (seconds)
+ADMIN_CACHE_TTL = float(os.getenv('ADMIN_CACHE_TTL', '600'))
+# How often the background task refreshes admin lists of active chats (seconds)
+ADMIN_REFRESH_INTERVAL = float(os.getenv('ADMIN_REFRESH_INTERVAL', '300'))
+# Chats with no /cat for this long are no longer refreshed (seconds)
+ADMIN_ACTIVE_WINDOW = float(os.getenv('ADMIN_ACTIVE_WINDOW', '3600'))
+# A failed lookup is retried after this long rather than on every command
+ADMIN_FAILURE_TTL = 60.0
+
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+class AdminCache:
+    """
+    Admin status for (chat_id, user_id) pairs, answered from memory.
+
+    Each chat's administrator list is fetched with one
+    get_chat_administrators call and kept for ADMIN_CACHE_TTL seconds. A
+    background task refreshes the lists of recently active chats so checks
+    on the /cat path almost never wait for Telegram.
+    """
+
+    def __init__(self, ttl: float = ADMIN_CACHE_TTL):
+        self.ttl = ttl
+        # chat_id -> (admin user IDs, expires_at)
+        self._admins: Dict[int, Tuple[FrozenSet[int], float]] = {}
+        self._last_used: Dict[int, float] = {}
+        self._fetching: Dict[int, asyncio.Task] = {}
+        self._refresher: Optional[asyncio.Task] = None
+
+    async def is_admin(self, bot: Bot, chat: Optional[Chat], user_id: int) -> bool:
+        """Check whether a user is an administrator or owner of a chat."""
+        if chat is None or chat.type == ChatType.PRIVATE:
+            return False
+
+        now = time.monotonic()
+        self._last_used[chat.id] = now
+        entry = self._admins.get(chat.id)
+        if entry is None:
+            admins = await self._fetch(bot, chat.id)
+        else:
+            admins, expires_at = entry
+            if expires_at <= now:
+                # Answer from the stale list and refresh in the background
+                self._refresh_later(bot, chat.id)
+        return user_id in admins
+
+    def invalidate(self, chat_id: int) -> None:
+        """Forget a chat's admin list, e.g. after a membership change."""
+        self._admins.pop(chat_id, None)
+
+    def _refresh_later(self, bot: Bot, chat_id: int) -> None:
+        if chat_id not in self._fetching:
+            self._fetching[chat_id] = asyncio.create_task(self._load(bot, chat_id))
+
+    async def _fetch(self, bot: Bot, chat_id: int) -> FrozenSet[int]:
+        """Fetch a chat's admin list, sharing one request between concurrent callers."""
+        self._refresh_later(bot, chat_id)
+        return await asyncio.shield(self._fetching[chat_id])
+
+    async def _load(self, bot: Bot, chat_id: int) -> FrozenSet[int]:
+        try:
+            members = await bot.get_chat_administrators(chat_id)
+            admins = frozenset(
+                member.user.id for member in members if member.status in ADMIN_STATUSES
+            )
+            expires_at = time.monotonic() + self.ttl
+        except TelegramError as e:
+            logger.warning("Could not load admins for chat %s: %s", chat_id, e)
+            previous = self._admins.get(chat_id)
+            admins = previous[0] if previous else frozenset()
+            expires_at = time.monotonic() + ADMIN_FAILURE_TTL
+        finally:
+            self._fetching.pop(chat_id, None)
+        self._admins[chat_id] = (admins, expires_at)
+        return admins
+
+    def start(self, bot: Bot) -> None:
+        """Start refreshing active chats' admin lists in the background."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_periodically(bot))
+
+    async def stop(self) -> None:
+        """Stop the background refresh."""
+        tasks = list(self._fetching.values())
+        if self._refresher is not None:
+            tasks.append(self._refresher)
+            self._refresher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _refresh_periodically(self, bot: Bot) -> None:
+        while True:
+            await asyncio.sleep(ADMIN_REFRESH_INTERVAL)
+            now = time.monotonic()
+            for chat_id, last_used in list(self._last_used.items()):
+                if now - last_used > ADMIN_ACTIVE_WINDOW:
+                    # Inactive chats drop out; they are fetched again on next use
+                    del self._last_used[chat_id]
+                    self._admins.pop(chat_id, None)
+                    continue
+                if self._admins.get(chat_id, (None, 0.0))[1] - now < ADMIN_REFRESH_INTERVAL:
+                    await self._fetch(bot, chat_id)
@@ -0,0 +1,209 @@
+"""
+End-to-end load benchmark against the local mock servers.
+
+Drives simulated users through the real /cat and /status handlers, so each
+request passes through RateLimiter, TaskManager, the scheduler, the poller
+and delivery. Minimax and Telegram are served by mock_minimax.py. Reports
+throughput, latency percentiles, peak memory and upstream request counts:
+
+    python benchmark.py --users 2000 --output before.json
+    python benchmark.py --users 2000 --baseline before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from mock_minimax import FakeTelegram, MockServer, add_mock_arguments, mock_from_arguments
+
+BENCHMARK_TOKEN = '123456:BENCHMARK'
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def configure_environment(server_url: str, workdir: str, callbacks: bool) -> None:
+    """Point the bot at the mock servers. Must run before bot is imported."""
+    if callbacks:
+        port = free_port()
+        os.environ.update({
+            'MINIMAX_CALLBACK_URL': f'http://127.0.0.1:{port}/minimax-callback',
+            'MINIMAX_CALLBACK_PORT': str(port),
+            'MINIMAX_CALLBACK_SECRET': 'benchmark',
+        })
+    os.environ.update({
+        'TELEGRAM_TOKEN': BENCHMARK_TOKEN,
+        'MINIMAX_API_KEY': 'benchmark',
+        'MINIMAX_GROUP_ID': 'benchmark',
+        'AI_SERVICE_URL': f'{server_url}/v1',
+        'TASK_DB_PATH': os.path.join(workdir, 'tasks.db'),
+        'MINIMAX_RETRY_BASE_DELAY': '0.05',
+    })
+    # Fast polling so runs take seconds; explicit settings in the environment win
+    for name, value in (
+        ('POLL_INTERVAL_QUEUEING', '0.5'),
+        ('POLL_INTERVAL_PREPARING', '0.5'),
+        ('POLL_INTERVAL_PROCESSING', '0.25'),
+        ('POLL_MAX_INTERVAL', '1'),
+        ('RATE_LIMIT_POLICIES', 'user:window:1/3600'),
+    ):
+        os.environ.setdefault(name, value)
+
+def command_update(bot, update_id: int, user_id: int, text: str):
+    from telegram import Update
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'User'},
+            'text': text,
+        },
+    }, bot)
+
+async def run(args: argparse.Namespace) -> Dict:
+    workdir = tempfile.mkdtemp(prefix='catbot-bench-')
+    # Relative state files (rate_limits.json) land in the scratch directory
+    os.chdir(workdir)
+
+    delivered_at: Dict[int, float] = {}
+    telegram = FakeTelegram(BENCHMARK_TOKEN, on_video=lambda chat_id: delivered_at.setdefault(chat_id, time.perf_counter()))
+    minimax = mock_from_arguments(args)
+    server = MockServer(minimax, telegram)
+    await server.start()
+    configure_environment(server.url, workdir, args.callbacks)
+
+    startup_started = time.perf_counter()
+    import bot as catbot
+    from telegram import Bot
+
+    tg_bot = Bot(BENCHMARK_TOKEN, base_url=f'{server.url}/bot')
+    await tg_bot.initialize()
+    application = SimpleNamespace(bot=tg_bot)
+    await catbot.post_init(application)
+    startup = time.perf_counter() - startup_started
+
+    actions = ['chase', 'eat', 'sleep on', 'jump over', 'play with', 'sit in']
+    objects = ['butterfly', 'fish', 'box', 'laptop', 'yarn ball', 'sunbeam']
+    started_at: Dict[int, float] = {}
+    command_latency: Dict[str, List[float]] = {'cat': [], 'status': []}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    update_ids = iter(range(1, 10 ** 9))
+
+    async def handle(name: str, handler, user_id: int, command_args: List[str]) -> None:
+        update = command_update(tg_bot, next(update_ids), user_id, f"/{name} {' '.join(command_args)}")
+        context = SimpleNamespace(bot=tg_bot, args=command_args)
+        async with semaphore:
+            started = time.perf_counter()
+            await handler(update, context)
+            command_latency[name].append(time.perf_counter() - started)
+
+    async def simulate_user(user_id: int) -> None:
+        await asyncio.sleep(random.uniform(0, args.ramp_up))
+        started_at[user_id] = time.perf_counter()
+        await handle('cat', catbot.cat_command, user_id, [random.choice(actions), random.choice(objects)])
+        if random.random() < args.status_ratio and catbot.task_manager.tasks:
+            task_id = random.choice(list(catbot.task_manager.tasks))
+            await handle('status', catbot.status_command, user_id, [task_id])
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    bench_started = time.perf_counter()
+    await asyncio.gather(*(simulate_user(user_id) for user_id in range(1, args.users + 1)))
+    # Wait for the poller to deliver everything it is watching
+    deadline = time.perf_counter() + args.timeout
+    while catbot.task_poller.pending_count and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - bench_started
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    undelivered = catbot.task_poller.pending_count
+    await catbot.post_stop(application)
+    await catbot.post_shutdown(application)
+    await tg_bot.shutdown()
+    await server.stop()
+
+    end_to_end = [delivered_at[user] - started for user, started in started_at.items() if user in delivered_at]
+    result = {
+        'users': args.users,
+        'startup_s': round(startup, 3),
+        'elapsed_s': round(elapsed, 3),
+        'commands_per_s': round(sum(len(v) for v in command_latency.values()) / elapsed, 2),
+        'videos_delivered': len(end_to_end),
+        'videos_per_s': round(len(end_to_end) / elapsed, 2),
+        'tasks_undelivered': undelivered,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'upstream_requests': dict(sorted(minimax.requests.items())),
+        'telegram_requests': dict(sorted(telegram.requests.items())),
+    }
+    if traced_peak is not None:
+        result['traced_peak_mb'] = round(traced_peak / 1024 ** 2, 1)
+    for name, values in (('cat', command_latency['cat']), ('status', command_latency['status']), ('end_to_end', end_to_end)):
+        for label, fraction in (('p50', 0.5), ('p99', 0.99)):
+            value = percentile(values, fraction)
+            result[f'{name}_{label}_s'] = round(value, 4) if value is not None else None
+    return result
+
+def print_report(result: Dict, baseline: Optional[Dict]) -> None:
+    for key, value in result.items():
+        if isinstance(value, dict):
+            print(f"{key}:")
+            for name, count in value.items():
+                previous = (baseline or {}).get(key, {}).get(name)
+                suffix = f"  (baseline {previous})" if previous is not None and previous != count else ''
+                print(f"  {name:<24} {count}{suffix}")
+            continue
+        previous = (baseline or {}).get(key)
+        suffix = ''
+        if isinstance(value, (int, float)) and isinstance(previous, (int, float)) and previous:
+            suffix = f"  (baseline {previous}, {100 * (value - previous) / previous:+.1f}%)"
+        print(f"{key:<26} {value}{suffix}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000, help='simulated users, one /cat each')
+    parser.add_argument('--status-ratio', type=float, default=0.5, help='fraction of users that also send /status')
+    parser.add_argument('--concurrency', type=int, default=200, help='commands handled at once')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='spread user arrivals over this many seconds')
+    parser.add_argument('--timeout', type=float, default=300.0, help='give up waiting for deliveries after this long')
+    parser.add_argument('--callbacks', action='store_true', help='receive completions by Minimax callback')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the Python heap peak (slower)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results written earlier with --output')
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+
+    result = asyncio.run(run(args))
+    print_report(result, baseline)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+    sys.exit(1 if result['tasks_undelivered'] else 0)
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,86 @@
 import os
 import re
+import time
+import heapq
+import random
+import socket
 import asyncio
+import functools
+import contextlib
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Optional
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import tempfile
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram import Bot, InputMediaVideo, Message, Update
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import Application, ChatMemberHandler, CommandHandler, ContextTypes
 from dotenv import load_dotenv
-from minimax_client import MinimaxClient
 import logging
-from rate_limiter import RateLimiter
 
-# Set up logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+# Load .env before the modules below read their settings from the environment
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+from minimax_client import CircuitOpenError, MinimaxClient, MinimaxError
+from metrics import (
+    GENERATION_OUTCOMES, POLLER_DEPTH, TASKS_IN_FLIGHT, TASKS_QUEUED,
+    TELEGRAM_UPLOAD_LATENCY, MetricsServer,
 )
-logger = logging.getLogger(__name__)
+from lifecycle import Lifecycle
+from log_format import make_formatter
+from rate_limiter import RateLimiter
+from scheduler import GenerationScheduler, QueuedCallback, SchedulerClosed
+from state_backend import StateBackend
+from update_processor import FairUpdateProcessor
+from admin_cache import ADMIN_STATUSES, AdminCache
+from callback_receiver import CALLBACK_URL, CallbackReceiver
+from message_editor import MessageEditor
+from task_store import FINAL_STATUSES, MAX_MONITOR_ROUNDS, TASK_RETENTION_SECONDS, TaskStore
+from video_cache import VideoCache
+from video_processing import TELEGRAM_UPLOAD_LIMIT, VideoProcessor
 
-# Load environment variables
-load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+# Set up logging; LOG_LEVEL=DEBUG adds per-request details such as status responses.
+# LOG_FORMAT=json or kv writes structured lines for log collectors.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(make_formatter(LOG_FORMAT))
+logging.basicConfig(handlers=[log_handler], level=LOG_LEVEL)
+# httpx logs every Bot API request at INFO
+logging.getLogger('httpx').setLevel(max(logging.WARNING, logging.getLogger().level))
+logger = logging.getLogger(__name__)
 
 # Constants
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 if not TELEGRAM_TOKEN:
-    print("Error: TELEGRAM_TOKEN not found in .env file")
-    print("Current working directory:", os.getcwd())
-    print("Looking for .env in:", os.path.join(os.path.dirname(__file__), '.env'))
+    logger.error(
+        "TELEGRAM_TOKEN not found in .env file (working directory %s, looked in %s)",
+        os.getcwd(), os.path.join(os.path.dirname(__file__), '.env'),
+    )
+
+# Optional self-hosted Bot API server (telegram-bot-api --local). In local mode
+# videos are handed over by path instead of being uploaded through the bot.
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+TELEGRAM_LOCAL_MODE = os.getenv('TELEGRAM_LOCAL_MODE', '').lower() in ('1', 'true', 'yes')
+
+# Webhook mode: set WEBHOOK_URL to the public URL the reverse proxy forwards
+# to WEBHOOK_LISTEN:WEBHOOK_PORT. Without it the bot uses long polling.
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Several workers may share one TASK_DB_PATH. Each needs a distinct WORKER_ID
+# that stays the same across restarts, so a restarted worker resumes its tasks
+# at once instead of waiting for its old leases to expire. The hostname default
+# suits one worker per host; set WORKER_ID when running several on one host.
+WORKER_ID = os.getenv('WORKER_ID') or socket.gethostname()
+# Telegram leaves chat_member updates out unless they are asked for
+ALLOWED_UPDATES = [Update.MESSAGE, Update.EDITED_MESSAGE, Update.CHAT_MEMBER]
+# Keep rate limits in the shared state backend instead of a per-worker file
+SHARED_RATE_LIMITS = os.getenv('SHARED_RATE_LIMITS', '').lower() in ('1', 'true', 'yes')
 
 # Messages
 GREETING_MESSAGE = """
@@ -41,7 +95,11 @@ HELP_MESSAGE = """
 🎮 *Available Commands*
 
 🎥 `/cat [action] [object]` - Generate a cat video
-   Example: `/cat chase butterfly`
+   Example: `/cat chase butterfly`{fresh_hint}
+
+🎞 `/batch [count] [action] [object]` - Generate several videos at once
+   Example: `/batch 3 chase butterfly`
+   Or: `/batch chase butterfly; eat fish; sleep box`
 
 🔍 `/status [taskID]` - Check video status
    Example: `/status 224083523223649`
@@ -51,74 +109,194 @@ HELP_MESSAGE = """
 """
 
 PROCESSING_MESSAGE = "🎬 Your cat video is being generated!"
+DONE_MESSAGE = "✅ Your cat video is done!"
+FAILED_MESSAGE = "❌ Your cat video could not be generated."
 STATUS_MESSAGE = "🔄 Current status: *{status}*"
 WAIT_MESSAGE = "⏳ This usually takes 3-5 minutes. The video will be sent here when it's ready."
 TASK_ID_FORMAT = "🔑 Task ID: `{task_id}`"
+QUEUED_MESSAGE = "⏳ The video studio is busy. You're number {position} in the queue, your video will start soon."
+READY_MESSAGE = "✨ Your magical cat video is ready! 🎬"
+VIDEO_TOO_LARGE_MESSAGE = "📦 This video is too large to send here. Download it: {url}"
+FAIL_MESSAGE = "❌ Sorry, something went wrong while creating your video. Please try again!"
+SHUTTING_DOWN_MESSAGE = "🔧 The bot is restarting. Please send your request again in a minute."
+MONITOR_ERROR_MESSAGE = "❌ Sorry, there was an error monitoring your video generation. Please check again later with /status."
+BATCH_USAGE_MESSAGE = (
+    "Please provide a count or several action/object pairs.\n"
+    "Example: `/batch 3 chase butterfly` or `/batch chase butterfly; eat fish`"
+)
+BATCH_TOO_LARGE_MESSAGE = "❌ A batch can have at most {limit} videos."
+BATCH_SUBMITTING_MESSAGE = "🎬 Starting {count} cat videos..."
+BATCH_SUBMIT_FAILED_MESSAGE = "❌ Sorry, none of the videos in this batch could be started. Please try again!"
+BATCH_STATUS_MESSAGE = (
+    "🎬 *Batch of {total} cat videos*\n"
+    "✅ {ready} ready · ⏳ {pending} in progress · ❌ {failed} failed\n"
+    "🔑 Batch ID: `{group_id}`"
+)
+BATCH_DELIVERY_FAILED_MESSAGE = "\n\n❌ Sorry, the finished videos could not be sent."
 RATE_LIMIT_MESSAGE = """⏳ Rate limit exceeded!
 You can generate one video per hour.
 Time remaining: {} minutes"""
 
+# Base cat description
+CAT_DESCRIPTION = (
+    "the iconic white Persian cat from the reference image - "
+    "maintain its exact appearance: the fluffy pure white fur, round face, flat nose, "
+    "grey eyes with that characteristic stern expression, and small ears hidden in the fluff"
+)
+
+# Camera and scene enhancements based on keywords, in priority order
+CAMERA_DIRECTIONS = {
+    'eat': "Close-up shots of the cat's face, occasionally pulling back to show the full scene. Focus on the cat's expressions.",
+    'chase': "Dynamic tracking shots following the cat's movement, mixing close-ups of the determined expression with wider shots of the action.",
+    'sleep': "Gentle, slow panning shots. Occasional close-ups of the peaceful sleeping face.",
+    'play': "Mix of tracking shots and dynamic angles, capturing both the playful action and the cat's expressions.",
+    'walk': "Smooth tracking shots from various angles, showing both the cat's movement and the environment.",
+    'sit': "Steady shots that slowly circle around the cat, with occasional close-ups of its regal expression.",
+    'jump': "Dynamic upward tracking shots, following the cat's graceful movement through the air.",
+    'run': "Fast-paced tracking shots with dramatic angles, capturing the speed and energy.",
+    'dance': "Smooth, circular camera movements that follow the rhythm, mixing wide and close-up shots.",
+    'explore': "Following shots that reveal the environment as the cat discovers it.",
+}
+DEFAULT_CAMERA_DIRECTION = "Mix of close-ups and wider shots, focusing on both the cat's expressions and the overall scene."
+# Forms that suffix rules don't cover: irregular verbs, plus agent nouns listed
+# one by one because a generated -er would also match words like "jumper"
+IRREGULAR_KEYWORD_FORMS = {
+    'ate': 'eat', 'eaten': 'eat', 'slept': 'sleep', 'sat': 'sit', 'ran': 'run',
+    'runner': 'run', 'runners': 'run', 'dancer': 'dance', 'dancers': 'dance',
+    'explorer': 'explore', 'explorers': 'explore',
+}
+
+PROMPT_TEMPLATE = (
+    "Create a cinematic video featuring " + CAT_DESCRIPTION + ". "
+    "\nScene: The Persian cat is {action} {object}. "
+    "\nCinematography: {camera} "
+    "\nMaintain consistent lighting and ensure the cat's appearance matches the reference image exactly. "
+    "The cat should look like it was taken directly from the reference and placed into this new scene. "
+    "Create an appropriate, atmospheric environment that enhances the mood of the action."
+)
+
+def _keyword_forms(keyword: str) -> List[str]:
+    """Regular verb inflections of a keyword (chase -> chases, chased, chasing)."""
+    forms = [keyword]
+    # -es only after sibilants, so "sit" doesn't also match "sites"
+    forms.append(keyword + ('es' if keyword.endswith(('s', 'x', 'z', 'ch', 'sh')) else 's'))
+    if keyword.endswith('e'):
+        forms += [keyword + 'd', keyword[:-1] + 'ing']
+    elif (len(keyword) >= 3 and keyword[-1] not in 'aeiouwy'
+          and keyword[-2] in 'aeiou' and keyword[-3] not in 'aeiou'):
+        # Consonant-vowel-consonant doubles the final letter: run -> running
+        doubled = keyword + keyword[-1]
+        forms += [doubled + 'ing', doubled + 'ed']
+    else:
+        forms += [keyword + 'ed', keyword + 'ing']
+    return forms
+
+def _compile_camera_matcher() -> Dict[str, int]:
+    """Map every recognised word form to the priority of its camera direction."""
+    matcher = {}
+    for priority, keyword in enumerate(CAMERA_DIRECTIONS):
+        for form in _keyword_forms(keyword):
+            matcher.setdefault(form, priority)
+    for form, keyword in IRREGULAR_KEYWORD_FORMS.items():
+        matcher[form] = list(CAMERA_DIRECTIONS).index(keyword)
+    return matcher
+
+CAMERA_MATCHER = _compile_camera_matcher()
+CAMERA_DIRECTION_LIST = list(CAMERA_DIRECTIONS.values())
+WORD_RE = re.compile(r"[a-z]+")
+
+def camera_description(action: str, object_: str) -> str:
+    """Pick camera directions for the whole words in a request."""
+    # Check for keywords in both action and object
+    matches = {
+        CAMERA_MATCHER[word]
+        for word in WORD_RE.findall(f"{action} {object_}".lower())
+        if word in CAMERA_MATCHER
+    }
+    if not matches:
+        return DEFAULT_CAMERA_DIRECTION
+    # Combine matching directions, but don't make it too long
+    return " ".join(CAMERA_DIRECTION_LIST[i] for i in sorted(matches)[:2])
+
+def build_prompt(action: str, object_: str) -> str:
+    """Build the cinematic generation prompt for an action/object pair."""
+    return PROMPT_TEMPLATE.format(
+        action=action, object=object_, camera=camera_description(action, object_)
+    )
+
+# How often old tasks are evicted from memory and the task store (seconds)
+EVICTION_INTERVAL = 3600
+
+# Opt-in prompt deduplication: identical /cat requests share one generation
+PROMPT_DEDUP = os.getenv('PROMPT_DEDUP', '').lower() in ('1', 'true', 'yes')
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '200'))
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', str(24 * 3600)))
+FRESH_FLAG = '--fresh'
+# Only shown in /help when PROMPT_DEDUP is on; otherwise the flag changes nothing
+FRESH_HINT = "\n   Add `--fresh` to skip reusing a recent identical video"
+# /status answers from the last known status if it was checked this recently (seconds)
+STATUS_CACHE_TTL = float(os.getenv('STATUS_CACHE_TTL', '30'))
+# Videos per /batch; Telegram media groups hold at most 10
+BATCH_MAX_SIZE = min(int(os.getenv('BATCH_MAX_SIZE', '4')), 10)
+
+def canonical_prompt_key(action: str, object_: str) -> str:
+    """Normalize an action/object pair so equivalent requests compare equal."""
+    def normalize(text: str) -> str:
+        return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+    return f"{normalize(action)}|{normalize(object_)}"
+
 class TaskManager:
-    def __init__(self):
+    def __init__(
+        self,
+        store: Optional[StateBackend] = None,
+        scheduler: Optional[GenerationScheduler] = None,
+    ):
         self.tasks: Dict[str, Dict] = {}
         self.minimax_client = MinimaxClient()
+        self.store = store
+        self.scheduler = scheduler
+        self._last_eviction = 0.0
+        # Prompt dedup state: key -> pending task_id, key -> (task_id, completed_at)
+        self._inflight: Dict[str, str] = {}
+        self._results: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self._submitting: Dict[str, asyncio.Future] = {}
+        # Batches delivered together: group_id -> group record
+        self.groups: Dict[str, Dict] = {}
+        # In-flight upstream status queries, shared by concurrent callers
+        self._status_queries: Dict[str, asyncio.Future] = {}
+        # Called with (task_id, task) whenever a task's status changes
+        self.on_status_change: Optional[Callable[[str, Dict], None]] = None
         
     def generate_task_id(self) -> str:
         """Generate a unique 22-digit task ID."""
         timestamp = int(datetime.now().timestamp() * 1000000)
         return str(timestamp).zfill(22)
     
-    async def create_task(self, user_id: int, action: str, object_: str) -> str:
-        """Create a new video generation task."""
-        # Base cat description
-        cat_desc = (
-            "the iconic white Persian cat from the reference image - "
-            "maintain its exact appearance: the fluffy pure white fur, round face, flat nose, "
-            "grey eyes with that characteristic stern expression, and small ears hidden in the fluff"
-        )
-        
-        # Camera and scene enhancements based on keywords
-        camera_directions = {
-            'eat': "Close-up shots of the cat's face, occasionally pulling back to show the full scene. Focus on the cat's expressions.",
-            'chase': "Dynamic tracking shots following the cat's movement, mixing close-ups of the determined expression with wider shots of the action.",
-            'sleep': "Gentle, slow panning shots. Occasional close-ups of the peaceful sleeping face.",
-            'play': "Mix of tracking shots and dynamic angles, capturing both the playful action and the cat's expressions.",
-            'walk': "Smooth tracking shots from various angles, showing both the cat's movement and the environment.",
-            'sit': "Steady shots that slowly circle around the cat, with occasional close-ups of its regal expression.",
-            'jump': "Dynamic upward tracking shots, following the cat's graceful movement through the air.",
-            'run': "Fast-paced tracking shots with dramatic angles, capturing the speed and energy.",
-            'dance': "Smooth, circular camera movements that follow the rhythm, mixing wide and close-up shots.",
-            'explore': "Following shots that reveal the environment as the cat discovers it.",
-        }
-        
-        # Check for keywords in both action and object
-        full_prompt = f"{action} {object_}".lower()
-        matching_directions = []
-        
-        # Find all matching keywords
-        for keyword, direction in camera_directions.items():
-            if keyword in full_prompt:
-                matching_directions.append(direction)
-        
-        # If no keywords match, use default
-        if not matching_directions:
-            camera_desc = "Mix of close-ups and wider shots, focusing on both the cat's expressions and the overall scene."
-        else:
-            # Combine matching directions, but don't make it too long
-            camera_desc = " ".join(matching_directions[:2])  # Limit to 2 matching directions
+    async def create_task(
+        self,
+        user_id: int,
+        action: str,
+        object_: str,
+        on_queued: Optional[QueuedCallback] = None,
+        request_key: Optional[str] = None,
+        group_id: Optional[str] = None,
+    ) -> str:
+        """Create a new video generation task.
+
+        request_key identifies the originating request (e.g. chat and message
+        ID) so a replayed request reuses its task instead of paying twice.
+        group_id adds the task to a batch created with create_group.
+        """
+        prompt = build_prompt(action, object_)
         
-        # Build cinematic prompt
-        prompt = (
-            f"Create a cinematic video featuring {cat_desc}. "
-            f"\nScene: The Persian cat is {action} {object_}. "
-            f"\nCinematography: {camera_desc} "
-            "\nMaintain consistent lighting and ensure the cat's appearance matches the reference image exactly. "
-            "The cat should look like it was taken directly from the reference and placed into this new scene. "
-            "Create an appropriate, atmospheric environment that enhances the mood of the action."
+        # Submit task to Minimax, waiting for a slot if the scheduler is full
+        submit = functools.partial(
+            self.minimax_client.generate_video, prompt, idempotency_key=request_key
         )
-        
-        # Submit task to Minimax
-        task_id = await self.minimax_client.generate_video(prompt)
+        if self.scheduler:
+            task_id = await self.scheduler.submit(user_id, submit, on_queued)
+        else:
+            task_id = await submit()
         
         self.tasks[task_id] = {
             'user_id': user_id,
@@ -126,38 +304,862 @@ class TaskManager:
             'object': object_,
             'status': 'Processing',
             'timestamp': datetime.now().strftime('%H:%M'),
-            'prompt': prompt
+            'created_at': time.time(),
+            'prompt': prompt,
+            'deliveries': [],
         }
+        if group_id:
+            self.tasks[task_id]['group_id'] = group_id
+            self.groups[group_id]['task_ids'].append(task_id)
+        if self.store:
+            self.store.save_task(task_id, self.tasks[task_id])
+        self.evict_expired()
         return task_id
+
+    async def get_or_create_task(
+        self,
+        user_id: int,
+        action: str,
+        object_: str,
+        fresh: bool = False,
+        on_queued: Optional[QueuedCallback] = None,
+        request_key: Optional[str] = None,
+    ) -> Tuple[str, bool]:
+        """
+        Get a task for a request, reusing an identical one when prompt dedup is on.
+
+        Args:
+            user_id: The requesting user's ID
+            action: Action requested for the cat
+            object_: Object of the action
+            fresh: Skip the result cache and always submit a new generation
+            on_queued: Called with the queue position if the submit has to wait
+            request_key: Identifies the originating request for idempotent submits
+
+        Returns:
+            Tuple[str, bool]: (task_id, reused) where reused is True if the
+            task was shared with an earlier request
+        """
+        if not PROMPT_DEDUP:
+            return await self.create_task(user_id, action, object_, on_queued, request_key), False
+
+        key = canonical_prompt_key(action, object_)
+        if not fresh:
+            task_id = self._find_shared_task(key)
+            if task_id:
+                return task_id, True
+            # If the submit being waited on is cancelled, the first waiter to
+            # notice makes a new one and the rest wait on that
+            while key in self._submitting:
+                submitting = self._submitting[key]
+                try:
+                    return await asyncio.shield(submitting), True
+                except asyncio.CancelledError:
+                    if not submitting.cancelled():
+                        raise  # this request itself was cancelled
+
+        future = asyncio.get_running_loop().create_future()
+        self._submitting[key] = future
+        try:
+            task_id = await self.create_task(user_id, action, object_, on_queued, request_key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved; waiters (if any) still receive it
+            future.exception()
+            raise
+        else:
+            future.set_result(task_id)
+        finally:
+            if self._submitting.get(key) is future:
+                del self._submitting[key]
+
+        self._inflight[key] = task_id
+        return task_id, False
+
+    def _find_shared_task(self, key: str) -> Optional[str]:
+        """Find a pending or recently completed task for a dedup key."""
+        task_id = self._inflight.get(key)
+        if task_id:
+            task = self.tasks.get(task_id)
+            # Pending batch tasks only deliver to their group's chat
+            if task is not None and task['status'] not in FINAL_STATUSES and not task.get('group_id'):
+                return task_id
+            del self._inflight[key]
+
+        cached = self._results.get(key)
+        if cached:
+            task_id, completed_at = cached
+            if time.time() - completed_at < RESULT_CACHE_TTL and task_id in self.tasks:
+                self._results.move_to_end(key)
+                return task_id
+            del self._results[key]
+        return None
+
+    def _task_finished(self, task_id: str, task: Dict, status: Optional[str], record: bool = True) -> None:
+        """Free a finished task's scheduler slot and update the dedup caches."""
+        if record:
+            GENERATION_OUTCOMES.labels((status or 'abandoned').lower()).inc()
+        if self.scheduler:
+            self.scheduler.release(task_id)
+        if not PROMPT_DEDUP:
+            return
+        key = canonical_prompt_key(task['action'], task['object'])
+        if self._inflight.get(key) == task_id:
+            del self._inflight[key]
+        if status == 'Success':
+            self._results[key] = (task_id, time.time())
+            self._results.move_to_end(key)
+            while len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+
+    def create_group(self, user_id: int, chat_id: int, message_id: int, status_message_id: int) -> str:
+        """Start a batch whose tasks are delivered together in reply to message_id."""
+        group_id = f"b{self.generate_task_id()}"
+        self.groups[group_id] = {
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'status_message_id': status_message_id,
+            'created_at': time.time(),
+            'delivered': False,
+            'task_ids': [],
+        }
+        if self.store:
+            self.store.save_group(group_id, self.groups[group_id])
+        return group_id
+
+    def get_group(self, group_id: str) -> Optional[Dict]:
+        """Get a batch with the latest status of each task, read from the store if there is one."""
+        if self.store:
+            # Other workers may have finished some of the batch's tasks
+            return self.store.load_group(group_id)
+        group = self.groups.get(group_id)
+        if group is None:
+            return None
+        statuses = {
+            task_id: self.tasks[task_id]['status']
+            for task_id in group['task_ids'] if task_id in self.tasks
+        }
+        abandoned = [task_id for task_id in statuses if self.tasks[task_id].get('gave_up')]
+        return {**group, 'statuses': statuses, 'abandoned': abandoned}
+
+    def finish_group(self, group_id: str) -> bool:
+        """Claim a batch's delivery. Returns True only once per batch."""
+        if self.store:
+            return self.store.finish_group(group_id)
+        group = self.groups.get(group_id)
+        if group is None or group['delivered']:
+            return False
+        group['delivered'] = True
+        return True
+
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        """Get a task from memory, falling back to the task store."""
+        task = self.tasks.get(task_id)
+        if task is None and self.store:
+            task = self.store.load_task(task_id)
+            if task is not None:
+                self.tasks[task_id] = task
+        return task
+
+    def add_delivery(self, task_id: str, chat_id: int, message_id: int) -> None:
+        """Register a chat message that should receive the task's result."""
+        self.tasks[task_id]['deliveries'].append((chat_id, message_id))
+        if self.store:
+            self.store.add_delivery(task_id, chat_id, message_id)
+
+    def mark_delivered(self, task_id: str, chat_id: int, message_id: int) -> None:
+        """Record that a waiting chat received the task's result."""
+        deliveries = self.tasks[task_id]['deliveries']
+        if (chat_id, message_id) in deliveries:
+            deliveries.remove((chat_id, message_id))
+        if self.store:
+            self.store.mark_delivered(task_id, chat_id, message_id)
+
+    def set_status_message(self, task_id: str, chat_id: int, message_id: int, status_message_id: int) -> None:
+        """Remember the progress message sent for a delivery so it can be edited later."""
+        self.tasks[task_id].setdefault('status_messages', {})[(chat_id, message_id)] = status_message_id
+        if self.store:
+            self.store.set_status_message(task_id, chat_id, message_id, status_message_id)
+
+    def status_messages(self, task_id: str) -> List[Tuple[int, int]]:
+        """(chat_id, status_message_id) of every progress message shown for a task."""
+        if self.store:
+            return self.store.load_status_messages(task_id)
+        task = self.tasks.get(task_id, {})
+        return [
+            (chat_id, status_message_id)
+            for (chat_id, _), status_message_id in task.get('status_messages', {}).items()
+        ]
+
+    def pending_deliveries(self, task_id: str) -> List[Tuple[int, int]]:
+        """Chats still waiting on a task, including ones registered by other workers."""
+        if self.store:
+            return self.store.load_deliveries(task_id)
+        return list(self.tasks[task_id]['deliveries'])
+
+    def claim_delivery(self, task_id: str, chat_id: int, message_id: int) -> bool:
+        """Reserve a delivery for this worker so no other worker sends it too."""
+        if not self.store:
+            return True
+        return self.store.claim_delivery(task_id, chat_id, message_id, WORKER_ID)
+
+    def release_delivery(self, task_id: str, chat_id: int, message_id: int) -> None:
+        """Hand back a delivery that could not be completed so it can be retried."""
+        if self.store:
+            self.store.release_delivery(task_id, chat_id, message_id, WORKER_ID)
+
+    def adopt_task(self, task_id: str, task: Dict) -> None:
+        """Take over a task loaded from the store, e.g. left by a stopped worker."""
+        self.tasks[task_id] = task
+        if task['status'] in FINAL_STATUSES:
+            return
+        if self.scheduler:
+            self.scheduler.adopt(task['user_id'], task_id)
+        if PROMPT_DEDUP and not task.get('group_id'):
+            # Batch tasks are delivered as a group, so a /cat can't share them
+            self._inflight[canonical_prompt_key(task['action'], task['object'])] = task_id
+
+    def abandon_task(self, task_id: str) -> None:
+        """Stop tracking a task that could not be monitored to completion."""
+        task = self.tasks.get(task_id)
+        if task is not None and task['status'] not in FINAL_STATUSES:
+            self._task_finished(task_id, task, None)
+
+    def give_up_task(self, task_id: str) -> bool:
+        """
+        Record that polling gave up on a task. Returns True once it has given
+        up MAX_MONITOR_ROUNDS times; until then the task stays unfinished in
+        the store and a later lease scan polls it again.
+        """
+        task = self.tasks.get(task_id)
+        if self.store and self.store.record_give_up(task_id) < MAX_MONITOR_ROUNDS:
+            if task is not None and task['status'] not in FINAL_STATUSES:
+                # Its slot is taken again when the task is re-adopted
+                self._task_finished(task_id, task, None, record=False)
+            return False
+        if task is not None:
+            task['gave_up'] = True
+        self.abandon_task(task_id)
+        return True
+
+    def evict_expired(self, force: bool = False) -> None:
+        """Drop tasks older than the retention period from memory and the store."""
+        now = time.time()
+        if not force and now - self._last_eviction < EVICTION_INTERVAL:
+            return
+        self._last_eviction = now
+        cutoff = now - TASK_RETENTION_SECONDS
+        for task_id in [tid for tid, task in self.tasks.items() if task['created_at'] < cutoff]:
+            del self.tasks[task_id]
+        for group_id in [gid for gid, group in self.groups.items() if group['created_at'] < cutoff]:
+            del self.groups[group_id]
+        if self.store:
+            removed = self.store.evict_expired()
+            if removed:
+                logger.info("Evicted %d expired tasks from the task store", removed)
     
     async def get_task_status(self, task_id: str) -> Optional[str]:
         """Get the status of a task."""
-        if task_id not in self.tasks:
+        task = self.get_task(task_id)
+        if task is None:
             return None
-            
+
+        # Concurrent callers (the poller, repeated /status) share one upstream query
+        query = self._status_queries.get(task_id)
+        if query is None:
+            query = asyncio.ensure_future(self._query_status(task_id))
+            self._status_queries[task_id] = query
+            query.add_done_callback(lambda _: self._status_queries.pop(task_id, None))
+        return await asyncio.shield(query)
+
+    async def _query_status(self, task_id: str) -> str:
         status, file_id = await self.minimax_client.check_generation_status(task_id)
-        self.tasks[task_id]['status'] = status
+        self.apply_status(task_id, status, file_id)
+        return status
+
+    def cached_status(self, task_id: str, max_age: float = STATUS_CACHE_TTL) -> Optional[str]:
+        """A task's last known status if it is final or was checked within max_age seconds."""
+        task = self.get_task(task_id)
+        if task is None:
+            return None
+        if task['status'] in FINAL_STATUSES or time.monotonic() - task.get('checked_at', float('-inf')) < max_age:
+            return task['status']
+        return None
+
+    def apply_status(self, task_id: str, status: str, file_id: Optional[str] = None) -> None:
+        """Record a task's status as reported by Minimax (polled or pushed)."""
+        task = self.get_task(task_id)
+        if task is None:
+            return
+        task['checked_at'] = time.monotonic()
+        changed = status != task['status']
+        task['status'] = status
         
         if status == 'Success' and file_id:
-            self.tasks[task_id]['file_id'] = file_id
-            
-        return status
+            changed = changed or task.get('file_id') != file_id
+            task['file_id'] = file_id
+
+        if changed and self.store:
+            self.store.update_status(task_id, status, task.get('file_id'))
+        if changed and status in FINAL_STATUSES:
+            self._task_finished(task_id, task, status)
+        if changed and self.on_status_change:
+            self.on_status_change(task_id, task)
 
     async def get_video_url(self, task_id: str) -> Optional[str]:
         """Get the video URL for a completed task."""
-        if task_id not in self.tasks or 'file_id' not in self.tasks[task_id]:
+        task = self.get_task(task_id)
+        if task is None or 'file_id' not in task:
             return None
             
-        return await self.minimax_client.get_video_url(self.tasks[task_id]['file_id'])
+        return await self.minimax_client.get_video_url(task['file_id'])
+
+# Status polling. Minimax has no batch query endpoint, so one poller owns every
+# pending task and spaces out checks per task instead of every task polling
+# on a fixed 10 second loop.
+PENDING_STATUSES = ('Queueing', 'Preparing', 'Processing')
+POLL_INTERVALS = {
+    'Queueing': float(os.getenv('POLL_INTERVAL_QUEUEING', '60')),
+    'Preparing': float(os.getenv('POLL_INTERVAL_PREPARING', '30')),
+    'Processing': float(os.getenv('POLL_INTERVAL_PROCESSING', '15')),
+}
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', '120'))
+POLL_CONCURRENCY = int(os.getenv('POLL_CONCURRENCY', '8'))
+POLL_MAX_ERRORS = 3
+# Initial guess for submit-to-success time; refined from observed completions
+EXPECTED_COMPLETION_SECONDS = 240.0
+# Delay before the first check of tasks restored from the store at startup
+RESTORE_POLL_DELAY = 1.0
+# With Minimax callbacks enabled, polling is only a safety net for lost
+# notifications and runs at most this often per task (seconds)
+CALLBACK_FALLBACK_INTERVAL = float(os.getenv('CALLBACK_FALLBACK_INTERVAL', '300'))
+# A worker owns polling of a task while it holds the task's lease. Leases are
+# renewed on every check, so they must outlast the longest poll interval.
+TASK_LEASE_TTL = float(os.getenv('TASK_LEASE_TTL', str(
+    3 * max(POLL_MAX_INTERVAL, CALLBACK_FALLBACK_INTERVAL if CALLBACK_URL else 0)
+)))
+# How often the store is scanned for tasks whose worker stopped (seconds)
+LEASE_SCAN_INTERVAL = float(os.getenv('LEASE_SCAN_INTERVAL', '60'))
+
+# Called with (task_id, final_status); status is None if polling gave up for good
+TaskCallback = Callable[[str, Optional[str]], Awaitable[None]]
+
+class TaskPoller:
+    """Poll all pending tasks from one loop with a bounded concurrency budget.
+
+    With a task store, each task is polled only while this worker holds its
+    lease, so several workers sharing a store never poll or deliver the same
+    task twice. Tasks left behind by stopped workers are picked up by a
+    periodic scan once their leases expire.
+    """
+
+    def __init__(
+        self,
+        task_manager: TaskManager,
+        concurrency: int = POLL_CONCURRENCY,
+        owner: str = WORKER_ID,
+        fallback_interval: Optional[float] = None,
+    ):
+        self.task_manager = task_manager
+        self.owner = owner
+        # Minimum time between checks when completions are pushed by callback
+        self.fallback_interval = fallback_interval
+        # Callback for tasks adopted from the store, which no handler is waiting on
+        self.default_callback: Optional[TaskCallback] = None
+        self._schedule: List[Tuple[float, str]] = []  # heap of (due time, task_id)
+        self._callbacks: Dict[str, List[TaskCallback]] = {}
+        self._errors: Dict[str, int] = {}
+        self._concurrency = asyncio.Semaphore(concurrency)
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+        self._scanner: Optional[asyncio.Task] = None
+        self._notifying: set = set()
+        self._checks: set = set()
+        self._expected_completion = EXPECTED_COMPLETION_SECONDS
+
+    @property
+    def pending_count(self) -> int:
+        """Number of tasks currently being watched or delivered."""
+        return len(self._callbacks.keys() | self._notifying)
+
+    def watch(self, task_id: str, callback: TaskCallback, delay: Optional[float] = None) -> None:
+        """Start polling a task; callback runs once it reaches a final status."""
+        first_watch = task_id not in self._callbacks
+        self._callbacks.setdefault(task_id, []).append(callback)
+        if first_watch:
+            # Claim the task before another worker's scan can; checked again in _run
+            self._hold_lease(task_id)
+            if delay is None:
+                status = self.task_manager.tasks.get(task_id, {}).get('status', 'Queueing')
+                delay = self._next_interval(task_id, status)
+            self._schedule_check(task_id, delay)
 
-class BotState:
-    def __init__(self):
-        self.is_running = False
-        self.task_manager = TaskManager()
+    def start(self) -> None:
+        """Start the polling loop on the running event loop."""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        if self.task_manager.store and (self._scanner is None or self._scanner.done()):
+            self._scanner = asyncio.create_task(self._scan_periodically())
+
+    async def stop(self, timeout: float = 0) -> None:
+        """Stop polling, giving checks and deliveries in flight up to `timeout` seconds to finish."""
+        runners = [runner for runner in (self._runner, self._scanner) if runner is not None]
+        self._runner = self._scanner = None
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        if self._checks and timeout > 0:
+            await asyncio.wait(list(self._checks), timeout=timeout)
+        checks = list(self._checks)
+        if checks:
+            logger.warning("Cancelling %d status checks or deliveries still in flight", len(checks))
+        for check in checks:
+            check.cancel()
+        await asyncio.gather(*checks, return_exceptions=True)
+        if self.task_manager.store:
+            # Let other workers take over right away instead of after TASK_LEASE_TTL
+            self.task_manager.store.release_leases(self.owner)
+
+    def _hold_lease(self, task_id: str) -> bool:
+        """Take or renew this worker's lease on a task."""
+        store = self.task_manager.store
+        return store is None or store.acquire_lease(task_id, self.owner, TASK_LEASE_TTL)
+
+    def adopt_orphans(self) -> int:
+        """Watch unfinished tasks in the store that no live worker holds. Returns how many."""
+        store = self.task_manager.store
+        if store is None or self.default_callback is None:
+            return 0
+        adopted = 0
+        for task_id, task in store.load_unfinished().items():
+            if task_id in self._callbacks or task_id in self._notifying:
+                continue
+            if not self._hold_lease(task_id):
+                continue
+            self.task_manager.adopt_task(task_id, task)
+            self.watch(task_id, self.default_callback, delay=RESTORE_POLL_DELAY)
+            adopted += 1
+        if adopted:
+            logger.info("Adopted %d unfinished tasks from the task store", adopted)
+        return adopted
+
+    async def _scan_periodically(self) -> None:
+        while True:
+            try:
+                self.adopt_orphans()
+            except Exception as e:
+                logger.error("Scanning for unowned tasks failed: %s", e)
+            await asyncio.sleep(LEASE_SCAN_INTERVAL)
+
+    def _schedule_check(self, task_id: str, delay: float) -> None:
+        heapq.heappush(self._schedule, (time.monotonic() + delay, task_id))
+        self._wakeup.set()
+
+    def _next_interval(self, task_id: str, status: str) -> float:
+        """Seconds until the next check, based on status and expected completion time."""
+        interval = POLL_INTERVALS.get(status, POLL_INTERVALS['Processing'])
+        created_at = self.task_manager.tasks.get(task_id, {}).get('created_at')
+        if created_at is not None:
+            # Far from the expected finish there is no point polling at full rate
+            remaining = self._expected_completion - (time.time() - created_at)
+            if remaining > interval:
+                interval = min(max(interval, remaining / 2), POLL_MAX_INTERVAL)
+        if self.fallback_interval:
+            interval = max(interval, self.fallback_interval)
+        return interval
+
+    def _record_completion(self, task_id: str) -> None:
+        created_at = self.task_manager.tasks.get(task_id, {}).get('created_at')
+        if created_at is not None:
+            duration = time.time() - created_at
+            self._expected_completion = 0.8 * self._expected_completion + 0.2 * duration
+
+    async def _run(self) -> None:
+        while True:
+            if not self._schedule:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            due, task_id = self._schedule[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                continue
+
+            heapq.heappop(self._schedule)
+            if task_id not in self._callbacks:
+                continue
+            if not self._hold_lease(task_id):
+                # Another worker owns the task and will deliver it
+                self._callbacks.pop(task_id, None)
+                self._errors.pop(task_id, None)
+                self.task_manager.abandon_task(task_id)
+                continue
+            await self._concurrency.acquire()
+            check = asyncio.create_task(self._check(task_id))
+            self._checks.add(check)
+            check.add_done_callback(self._checks.discard)
+
+    async def _check(self, task_id: str) -> None:
+        try:
+            status = await self.task_manager.get_task_status(task_id)
+        except CircuitOpenError as e:
+            # Upstream is known to be down: wait it out without spending retries
+            self._schedule_check(task_id, e.retry_after + random.uniform(0, POLL_INTERVALS['Processing']))
+            return
+        except Exception as e:
+            logger.warning("Status check failed for task %s: %s", task_id, e)
+            status = 'Error'
+        finally:
+            self._concurrency.release()
+
+        if task_id not in self._callbacks:
+            return  # finished by a callback while this check was running
+        if status in PENDING_STATUSES:
+            self._errors.pop(task_id, None)
+            self._schedule_check(task_id, self._next_interval(task_id, status))
+            return
+
+        if status is not None and status not in FINAL_STATUSES:
+            if status != 'Error':
+                logger.warning("Unexpected status for task %s: %s", task_id, status)
+            errors = self._errors[task_id] = self._errors.get(task_id, 0) + 1
+            if errors < POLL_MAX_ERRORS:
+                # Back off exponentially instead of retrying on a fixed beat
+                backoff = POLL_INTERVALS['Processing'] * (2 ** (errors - 1))
+                self._schedule_check(task_id, random.uniform(0.5, 1.0) * min(backoff, POLL_MAX_INTERVAL))
+                return
+            status = None
+
+        await self._finish(task_id, status)
+
+    async def on_callback(self, task_id: str, status: str, file_id: Optional[str]) -> None:
+        """Apply a status pushed by Minimax, delivering at once if the task finished."""
+        if task_id not in self._callbacks or task_id in self._notifying:
+            # Unknown here, already finishing, or owned by another worker whose poll will see it
+            logger.debug("Ignoring callback for task %s not watched by this worker", task_id)
+            return
+        if not self._hold_lease(task_id):
+            return
+        self.task_manager.apply_status(task_id, status, file_id)
+        if status in FINAL_STATUSES:
+            await self._finish(task_id, status)
+
+    async def _finish(self, task_id: str, status: Optional[str]) -> None:
+        self._errors.pop(task_id, None)
+        if status == 'Success':
+            self._record_completion(task_id)
+        elif status is None and not self.task_manager.give_up_task(task_id):
+            # Another round later; waiting chats aren't told until the last one
+            self._callbacks.pop(task_id, None)
+            self.task_manager.store.release_lease(task_id, self.owner)
+            return
+        await self._notify(task_id, status)
+
+    async def _notify(self, task_id: str, status: Optional[str]) -> None:
+        self._notifying.add(task_id)
+        try:
+            for callback in self._callbacks.pop(task_id, []):
+                try:
+                    await callback(task_id, status)
+                except Exception as e:
+                    logger.error("Task callback failed for %s: %s", task_id, e)
+        finally:
+            self._notifying.discard(task_id)
+        if self.task_manager.store:
+            # Undelivered results may now be retried by any worker
+            self.task_manager.store.release_lease(task_id, self.owner)
 
 # Initialize global managers
-task_manager = TaskManager()
-rate_limiter = RateLimiter()
+task_manager = TaskManager(TaskStore(), GenerationScheduler())
+task_poller = TaskPoller(task_manager, fallback_interval=CALLBACK_FALLBACK_INTERVAL if CALLBACK_URL else None)
+callback_receiver = CallbackReceiver(task_poller.on_callback)
+task_manager.minimax_client.callback_url = callback_receiver.callback_url
+video_cache = VideoCache(task_manager.store)
+video_processor = VideoProcessor()
+admin_cache = AdminCache()
+rate_limiter = RateLimiter(backend=task_manager.store if SHARED_RATE_LIMITS else None)
+metrics_server = MetricsServer()
+message_editor = MessageEditor()
+lifecycle = Lifecycle()
+update_processor = FairUpdateProcessor()
+# Queued /cat and /batch requests are turned away once shutdown starts
+lifecycle.on_shutdown(task_manager.scheduler.close)
+# Gauges read live values at scrape time, costing nothing between scrapes
+TASKS_IN_FLIGHT.set_function(lambda: task_manager.scheduler.in_flight)
+TASKS_QUEUED.set_function(lambda: task_manager.scheduler.queued)
+POLLER_DEPTH.set_function(lambda: task_poller.pending_count)
+
+def render_task_status(task_id: str, status: str) -> str:
+    """Text of a task's progress message, edited in place as the status changes."""
+    headers = {'Success': DONE_MESSAGE, 'Fail': FAILED_MESSAGE}
+    lines = [headers.get(status, PROCESSING_MESSAGE), STATUS_MESSAGE.format(status=status)]
+    if status not in FINAL_STATUSES:
+        lines.append(WAIT_MESSAGE)
+    lines.append(TASK_ID_FORMAT.format(task_id=task_id))
+    return '\n'.join(lines)
+
+def announce_status(task_id: str, task: Dict) -> None:
+    """Queue edits of a task's progress messages to show its new status."""
+    if task.get('group_id'):
+        return  # batches show aggregate progress, updated as their tasks finish
+    text = render_task_status(task_id, task['status'])
+    for chat_id, status_message_id in task_manager.status_messages(task_id):
+        message_editor.edit(chat_id, status_message_id, text, parse_mode='Markdown')
+
+task_manager.on_status_change = announce_status
+
+def local_file(bot: Bot, path: str, stack: contextlib.ExitStack):
+    """A file to upload: the path itself for a local Bot API server, else a handle closed by `stack`."""
+    # The local Bot API server reads the file itself; nothing is buffered here
+    return Path(path) if bot.local_mode else stack.enter_context(open(path, 'rb'))
+
+def video_attributes(bot: Bot, video: Dict, stack: contextlib.ExitStack) -> Dict:
+    """send_video arguments describing a fetched video: thumbnail, duration and size."""
+    attributes = {key: video[key] for key in ('duration', 'width', 'height') if video.get(key)}
+    if video.get('thumbnail'):
+        attributes['thumbnail'] = local_file(bot, video['thumbnail'], stack)
+    return attributes
+
+def video_too_large(bot: Bot, video: Dict) -> bool:
+    """Whether a video exceeds the Bot API upload limit; a local Bot API server has no such limit."""
+    return not bot.local_mode and os.path.getsize(video['path']) > TELEGRAM_UPLOAD_LIMIT
+
+async def reply_video_file(bot: Bot, chat_id: int, message_id: int, video: Dict) -> Message:
+    """Reply with a video stored on local disk, closing the file handles afterwards."""
+    with TELEGRAM_UPLOAD_LATENCY.labels('upload').time(), contextlib.ExitStack() as stack:
+        return await bot.send_video(
+            chat_id, local_file(bot, video['path'], stack), supports_streaming=True,
+            reply_to_message_id=message_id, allow_sending_without_reply=True,
+            **video_attributes(bot, video, stack),
+        )
+
+async def reply_oversized_video(bot: Bot, chat_id: int, message_id: int, task_id: str, video: Dict) -> None:
+    """Reply with a download link, and the animated preview when there is one, instead of the video."""
+    text = VIDEO_TOO_LARGE_MESSAGE.format(url=await get_download_url(task_id))
+    if not video.get('preview'):
+        await bot.send_message(chat_id, text, reply_to_message_id=message_id, allow_sending_without_reply=True)
+        return
+    with contextlib.ExitStack() as stack:
+        await bot.send_animation(
+            chat_id, local_file(bot, video['preview'], stack), caption=text,
+            reply_to_message_id=message_id, allow_sending_without_reply=True,
+        )
+
+async def get_download_url(task_id: str) -> Optional[str]:
+    """Get a task's download URL, asking Minimax only when the cached one expired."""
+    video_url = video_cache.get_download_url(task_id)
+    if not video_url:
+        video_url = await task_manager.get_video_url(task_id)
+        if video_url:
+            video_cache.set_download_url(task_id, video_url)
+    return video_url
+
+async def download_task_video(task_id: str) -> Optional[str]:
+    """Download a finished task's video to a temporary file the caller must remove."""
+    video_url = await get_download_url(task_id)
+    if not video_url:
+        return None
+    fd, path = tempfile.mkstemp(suffix='.mp4')
+    os.close(fd)
+    downloaded = False
+    try:
+        downloaded = await task_manager.minimax_client.download_video(video_url, path)
+    finally:
+        # Also reached when cancelled mid-download at shutdown
+        if not downloaded:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+    if not downloaded:
+        # The URL may have expired early; fetch a fresh one next time
+        video_cache.set_download_url(task_id, None)
+        return None
+    return path
+
+async def fetch_task_video(task_id: str) -> Optional[Dict]:
+    """
+    Get a finished task's video on local disk, post-processed when that is enabled.
+
+    Returns the video's 'path', plus 'thumbnail', 'preview', 'duration',
+    'width' and 'height' when it was processed. Pass it to
+    release_task_video() once sent.
+    """
+    processed = video_processor.cached(task_id)
+    if processed:
+        return processed
+    path = await download_task_video(task_id)
+    if path is None:
+        return None
+    keep = False
+    try:
+        processed = await video_processor.process(task_id, path)
+        if processed is None:
+            keep = True
+            return {'path': path, 'temporary': True}
+        return processed
+    finally:
+        # Processed outputs are kept for repeat deliveries, so the download is
+        # only needed when it is sent as is. It also goes if processing raised
+        # or this delivery was cancelled.
+        if not keep:
+            video_processor.discard_source(task_id, path)
+
+def release_task_video(video: Dict) -> None:
+    """Remove a fetched video unless it is kept for repeat deliveries."""
+    if video.get('temporary'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(video['path'])
+
+async def send_task_video(bot: Bot, chat_id: int, message_id: int, task_id: str, ready_text: str) -> bool:
+    """Reply with a finished task's video, resending by file_id when it was uploaded before."""
+    announced = False
+    file_id = video_cache.get_file_id(task_id)
+    if file_id:
+        await bot.send_message(
+            chat_id, ready_text,
+            reply_to_message_id=message_id, allow_sending_without_reply=True,
+        )
+        announced = True
+        try:
+            with TELEGRAM_UPLOAD_LATENCY.labels('file_id').time():
+                await bot.send_video(
+                    chat_id, file_id, supports_streaming=True,
+                    reply_to_message_id=message_id, allow_sending_without_reply=True,
+                )
+            return True
+        except BadRequest as e:
+            logger.warning("Cached file_id for task %s rejected, uploading again: %s", task_id, e)
+            video_cache.set_file_id(task_id, None)
+
+    video = await fetch_task_video(task_id)
+    if video is None:
+        return False
+    try:
+        if not announced:
+            await bot.send_message(
+                chat_id, ready_text,
+                reply_to_message_id=message_id, allow_sending_without_reply=True,
+            )
+        if video_too_large(bot, video):
+            await reply_oversized_video(bot, chat_id, message_id, task_id, video)
+            return True
+        sent = await reply_video_file(bot, chat_id, message_id, video)
+        if sent.video:
+            video_cache.set_file_id(task_id, sent.video.file_id)
+        return True
+    finally:
+        release_task_video(video)
+
+async def send_group_videos(bot: Bot, chat_id: int, message_id: int, task_ids: List[str]) -> bool:
+    """Reply with several finished videos as one media group."""
+    for attempt in range(2):
+        with contextlib.ExitStack() as stack:
+            media: List[InputMediaVideo] = []
+            sources: List[str] = []
+            oversized: List[Tuple[str, Dict]] = []
+            reused = False
+            for task_id in task_ids:
+                file_id = video_cache.get_file_id(task_id)
+                if file_id:
+                    reused = True
+                    media.append(InputMediaVideo(file_id, supports_streaming=True))
+                    sources.append(task_id)
+                    continue
+                video = await fetch_task_video(task_id)
+                if video is None:
+                    continue
+                stack.callback(release_task_video, video)
+                if video_too_large(bot, video):
+                    oversized.append((task_id, video))
+                    continue
+                media.append(InputMediaVideo(
+                    local_file(bot, video['path'], stack), supports_streaming=True,
+                    **video_attributes(bot, video, stack),
+                ))
+                sources.append(task_id)
+
+            if not media and not oversized:
+                return False
+            messages: List[Message] = []
+            try:
+                with TELEGRAM_UPLOAD_LATENCY.labels('media_group').time():
+                    if len(media) == 1:
+                        # Media groups need at least two items
+                        messages = [await bot.send_video(
+                            chat_id, media[0].media, supports_streaming=True,
+                            reply_to_message_id=message_id, allow_sending_without_reply=True,
+                            duration=media[0].duration, width=media[0].width,
+                            height=media[0].height, thumbnail=media[0].thumbnail,
+                        )]
+                    elif media:
+                        messages = await bot.send_media_group(
+                            chat_id, media,
+                            reply_to_message_id=message_id, allow_sending_without_reply=True,
+                        )
+            except BadRequest as e:
+                if not reused or attempt:
+                    raise
+                # One stale file_id fails the whole group; upload everything again
+                logger.warning("Cached file_ids rejected in media group, uploading again: %s", e)
+                for task_id in task_ids:
+                    video_cache.set_file_id(task_id, None)
+                continue
+            for task_id, video in oversized:
+                await reply_oversized_video(bot, chat_id, message_id, task_id, video)
+
+        for task_id, message in zip(sources, messages):
+            if message.video:
+                video_cache.set_file_id(task_id, message.video.file_id)
+        return True
+    return False
+
+def render_group_status(group_id: str, group: Dict) -> str:
+    """Aggregated progress text for a batch's status message."""
+    statuses = list(group['statuses'].values())
+    ready = statuses.count('Success')
+    # Tasks that could not be monitored to completion count as failed
+    failed = statuses.count('Fail') + len(group.get('abandoned', ()))
+    return BATCH_STATUS_MESSAGE.format(
+        total=len(statuses), ready=ready, pending=len(statuses) - ready - failed,
+        failed=failed, group_id=group_id,
+    )
+
+def edit_group_status(group_id: str, group: Dict, suffix: str = '') -> None:
+    """Queue an update of a batch's status message."""
+    message_editor.edit(
+        group['chat_id'], group['status_message_id'],
+        render_group_status(group_id, group) + suffix, parse_mode='Markdown',
+    )
+
+async def deliver_group_task(bot: Bot, group_id: str) -> None:
+    """Update a batch's progress, delivering all its videos once every task has finished."""
+    group = task_manager.get_group(group_id)
+    if group is None or group['delivered']:
+        return
+    statuses = group['statuses']
+    abandoned = group.get('abandoned', ())
+    if any(status not in FINAL_STATUSES and task_id not in abandoned for task_id, status in statuses.items()):
+        edit_group_status(group_id, group)
+        return
+    if not task_manager.finish_group(group_id):
+        return  # another worker finished the batch first
+
+    ready = [task_id for task_id, status in statuses.items() if status == 'Success']
+    delivered = True
+    if ready:
+        try:
+            delivered = await send_group_videos(bot, group['chat_id'], group['message_id'], ready)
+        except TelegramError as e:
+            logger.error("Failed to deliver batch %s: %s", group_id, e)
+            delivered = False
+    edit_group_status(group_id, group, '' if delivered else BATCH_DELIVERY_FAILED_MESSAGE)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /start command."""
@@ -165,37 +1167,46 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /help command."""
-    await update.message.reply_text(HELP_MESSAGE)
+    await update.message.reply_text(HELP_MESSAGE.format(fresh_hint=FRESH_HINT if PROMPT_DEDUP else ''))
 
 async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Check if the user is an admin in the current chat."""
     if not update.effective_chat:
         return False
-    
-    try:
-        chat_member = await context.bot.get_chat_member(
-            chat_id=update.effective_chat.id,
-            user_id=update.effective_user.id
-        )
-        return chat_member.status in ['administrator', 'creator']
-    except Exception:
-        return False
+    return await admin_cache.is_admin(context.bot, update.effective_chat, update.effective_user.id)
+
+async def chat_member_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Forget a chat's cached admin list when someone is promoted or demoted."""
+    change = update.chat_member
+    was_admin = change.old_chat_member.status in ADMIN_STATUSES
+    if was_admin != (change.new_chat_member.status in ADMIN_STATUSES):
+        admin_cache.invalidate(change.chat.id)
 
 async def cat_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /cat command."""
-    if not context.args or len(context.args) < 2:
+    args = list(context.args or [])
+    fresh = FRESH_FLAG in args
+    if fresh:
+        args.remove(FRESH_FLAG)
+
+    if len(args) < 2:
         await update.message.reply_text(
             "Please provide an action and object.\nExample: `/cat chase butterfly`",
             parse_mode='Markdown'
         )
         return
+    if not lifecycle.accepting:
+        await update.message.reply_text(SHUTTING_DOWN_MESSAGE)
+        return
 
     # Check if user is admin
     admin_status = await is_admin(update, context)
 
     # Check rate limit
     user_id = update.effective_user.id
-    allowed, seconds_remaining = rate_limiter.check_rate_limit(user_id, is_admin=admin_status)
+    allowed, seconds_remaining = rate_limiter.check_rate_limit(
+        user_id, is_admin=admin_status, chat_id=update.effective_chat.id
+    )
     
     if not allowed:
         minutes_remaining = int(seconds_remaining / 60)
@@ -205,25 +1216,136 @@ async def cat_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         )
         return
 
-    action = context.args[0]
-    object_ = ' '.join(context.args[1:])
+    # Waiting for a generation slot can take minutes; the user's later updates
+    # shouldn't queue behind it
+    update_processor.detach(update)
+
+    action = args[0]
+    object_ = ' '.join(args[1:])
+    chat_id = update.effective_chat.id
+    message_id = update.message.message_id
     
+    async def on_queued(position: int) -> None:
+        await update.message.reply_text(QUEUED_MESSAGE.format(position=position))
+
     try:
-        task_id = await task_manager.create_task(update.effective_user.id, action, object_)
-        
-        response = f"{PROCESSING_MESSAGE}\n"
-        response += f"{STATUS_MESSAGE.format(status='Processing')}\n"
-        response += f"{WAIT_MESSAGE}\n"
-        response += f"{TASK_ID_FORMAT.format(task_id=task_id)}"
-        
-        await update.message.reply_text(response, parse_mode='Markdown')
+        task_id, reused = await task_manager.get_or_create_task(
+            update.effective_user.id, action, object_, fresh=fresh, on_queued=on_queued,
+            request_key=f"{chat_id}:{message_id}",
+        )
+        status = task_manager.tasks[task_id]['status']
+
+        if status == 'Success':
+            # Identical prompt finished recently: resend it instead of generating again
+            if not await send_task_video(context.bot, chat_id, message_id, task_id, READY_MESSAGE):
+                await update.message.reply_text(MONITOR_ERROR_MESSAGE)
+            return
+
+        # Record where to deliver the result before yielding to the event loop
+        task_manager.add_delivery(task_id, chat_id, message_id)
+        if not reused:
+            # Hand the task to the shared poller
+            task_poller.watch(task_id, functools.partial(deliver_task, context.bot))
         
-        # Start monitoring the task
-        asyncio.create_task(monitor_task(update, task_id))
+        # This message is edited in place as the task progresses
+        status_message = await update.message.reply_text(
+            render_task_status(task_id, status), parse_mode='Markdown'
+        )
+        task_manager.set_status_message(task_id, chat_id, message_id, status_message.message_id)
+        task = task_manager.tasks[task_id]
+        if task['status'] != status:
+            # Changed while the reply was being sent
+            announce_status(task_id, task)
+    except SchedulerClosed:
+        await update.message.reply_text(SHUTTING_DOWN_MESSAGE)
     except Exception as e:
         error_message = f"Sorry, there was an error generating your video: {str(e)}"
         await update.message.reply_text(error_message)
-        print(f"Error in cat_command: {str(e)}")
+        logger.error("Error in cat_command: %s", e)
+
+def parse_batch_args(args: List[str]) -> Optional[List[Tuple[str, str]]]:
+    """
+    Parse /batch arguments into (action, object) pairs.
+
+    Accepts "N action object" for N variations of one prompt, or
+    "action object; action object; ..." for different prompts.
+    """
+    # isdigit() alone accepts characters such as '²' that int() rejects
+    if args and args[0].isascii() and args[0].isdigit():
+        count = int(args[0])
+        if count < 1 or len(args) < 3:
+            return None
+        # One more than the limit is enough for the caller to refuse the batch;
+        # never build a list as long as whatever number was typed
+        return [(args[1], ' '.join(args[2:]))] * min(count, BATCH_MAX_SIZE + 1)
+
+    pairs = []
+    for part in ' '.join(args).split(';'):
+        words = part.split()
+        if not words:
+            continue
+        if len(words) < 2:
+            return None
+        pairs.append((words[0], ' '.join(words[1:])))
+    return pairs or None
+
+async def batch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle the /batch command."""
+    pairs = parse_batch_args(list(context.args or []))
+    if pairs is None:
+        await update.message.reply_text(BATCH_USAGE_MESSAGE, parse_mode='Markdown')
+        return
+    if len(pairs) > BATCH_MAX_SIZE:
+        await update.message.reply_text(BATCH_TOO_LARGE_MESSAGE.format(limit=BATCH_MAX_SIZE))
+        return
+    if not lifecycle.accepting:
+        await update.message.reply_text(SHUTTING_DOWN_MESSAGE)
+        return
+
+    # One admin lookup and one rate limit check cover the whole batch. It is
+    # charged as a single request: charging per video would exceed the
+    # default 1-per-hour policy for any batch, however long the user waited.
+    # BATCH_MAX_SIZE and the scheduler's per-user limit bound what it costs.
+    admin_status = await is_admin(update, context)
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    allowed, seconds_remaining = rate_limiter.check_rate_limit(
+        user_id, is_admin=admin_status, chat_id=chat_id
+    )
+    if not allowed:
+        await update.message.reply_text(
+            RATE_LIMIT_MESSAGE.format(int(seconds_remaining / 60)),
+            parse_mode='Markdown'
+        )
+        return
+
+    update_processor.detach(update)
+    message_id = update.message.message_id
+    status_message = await update.message.reply_text(BATCH_SUBMITTING_MESSAGE.format(count=len(pairs)))
+    group_id = task_manager.create_group(user_id, chat_id, message_id, status_message.message_id)
+
+    # Submits run concurrently; the scheduler's per-user limit bounds them
+    results = await asyncio.gather(*(
+        task_manager.create_task(
+            user_id, action, object_,
+            request_key=f"{chat_id}:{message_id}:{index}", group_id=group_id,
+        )
+        for index, (action, object_) in enumerate(pairs)
+    ), return_exceptions=True)
+    task_ids = [result for result in results if isinstance(result, str)]
+    for error in results:
+        if isinstance(error, BaseException):
+            logger.error("Submitting a task of batch %s failed: %s", group_id, error)
+
+    if not task_ids:
+        task_manager.finish_group(group_id)
+        closed = all(isinstance(error, SchedulerClosed) for error in results)
+        await status_message.edit_text(SHUTTING_DOWN_MESSAGE if closed else BATCH_SUBMIT_FAILED_MESSAGE)
+        return
+
+    for task_id in task_ids:
+        task_poller.watch(task_id, functools.partial(deliver_task, context.bot))
+    edit_group_status(group_id, task_manager.get_group(group_id))
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the /status command."""
@@ -232,7 +1354,16 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
         
     task_id = context.args[0]
-    status = await task_manager.get_task_status(task_id)
+    # Finished or recently checked tasks are answered without an upstream query
+    status = task_manager.cached_status(task_id)
+    if status is None:
+        try:
+            status = await task_manager.get_task_status(task_id)
+        except MinimaxError as e:
+            # e.g. the circuit breaker is open; its message says when to retry
+            logger.warning("Status query for task %s failed: %s", task_id, e)
+            await update.message.reply_text(f"Sorry, the task status could not be checked: {e}")
+            return
     
     if status:
         await update.message.reply_text(
@@ -242,77 +1373,154 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         
         if status == 'Success':
-            video_url = await task_manager.get_video_url(task_id)
-            if video_url:
-                # Download and send the video
-                with tempfile.NamedTemporaryFile(suffix='.mp4') as temp_file:
-                    if await task_manager.minimax_client.download_video(video_url, temp_file.name):
-                        await update.message.reply_text("✨ Here's your video!")
-                        await update.message.reply_video(video=open(temp_file.name, 'rb'))
+            await send_task_video(
+                context.bot, update.effective_chat.id, update.message.message_id,
+                task_id, "✨ Here's your video!",
+            )
     else:
         await update.message.reply_text("❌ Task not found. Please check your task ID.")
 
-async def monitor_task(update: Update, task_id: str) -> None:
-    """Monitor a video generation task and send updates."""
-    max_retries = 3
-    retry_count = 0
-    
-    while True:
+async def deliver_task(bot: Bot, task_id: str, status: Optional[str]) -> None:
+    """Send a finished task's result to every chat still waiting on it."""
+    task = task_manager.get_task(task_id)
+    if task is None:
+        return
+    if task.get('group_id'):
+        await deliver_group_task(bot, task['group_id'])
+        return
+    for chat_id, message_id in task_manager.pending_deliveries(task_id):
+        if not task_manager.claim_delivery(task_id, chat_id, message_id):
+            continue  # another worker is sending this one
+        delivered = False
         try:
-            status = await task_manager.get_task_status(task_id)
-            
             if status == 'Success':
-                video_url = await task_manager.get_video_url(task_id)
-                if video_url:
-                    with tempfile.NamedTemporaryFile(suffix='.mp4') as temp_file:
-                        if await task_manager.minimax_client.download_video(video_url, temp_file.name):
-                            await update.message.reply_text("✨ Your magical cat video is ready! 🎬")
-                            await update.message.reply_video(video=open(temp_file.name, 'rb'))
-                break
+                delivered = await send_task_video(bot, chat_id, message_id, task_id, READY_MESSAGE)
             elif status == 'Fail':
-                await update.message.reply_text("❌ Sorry, something went wrong while creating your video. Please try again!")
-                break
-            elif status in ['Processing', 'Preparing', 'Queueing']:
-                await asyncio.sleep(10)  # Check every 10 seconds
+                await bot.send_message(
+                    chat_id, FAIL_MESSAGE,
+                    reply_to_message_id=message_id, allow_sending_without_reply=True,
+                )
+                delivered = True
+            if not delivered:
+                await bot.send_message(
+                    chat_id, MONITOR_ERROR_MESSAGE,
+                    reply_to_message_id=message_id, allow_sending_without_reply=True,
+                )
+                # Once polling has given up for good this notice is all the chat
+                # gets; a failed send is left undelivered and retried later
+                delivered = status is None
+        except TelegramError as e:
+            logger.error("Failed to deliver task %s to chat %s: %s", task_id, chat_id, e)
+        finally:
+            if delivered:
+                task_manager.mark_delivered(task_id, chat_id, message_id)
             else:
-                print(f"Unexpected status received: {status}")
-                retry_count += 1
-                if retry_count >= max_retries:
-                    await update.message.reply_text(f"⚠️ Unexpected status ({status}). Please try again or check later.")
-                    break
-                await asyncio.sleep(10)
-        except Exception as e:
-            print(f"Error in monitor_task: {str(e)}")
-            retry_count += 1
-            if retry_count >= max_retries:
-                await update.message.reply_text("❌ Sorry, there was an error monitoring your video generation. Please try again.")
-                break
-            await asyncio.sleep(10)
+                task_manager.release_delivery(task_id, chat_id, message_id)
+
+async def post_init(application: Application) -> None:
+    """Open shared resources once the application's event loop is running."""
+    await task_manager.minimax_client.start()
+    # The poller's first scan resumes everything left over from the last run
+    task_poller.default_callback = functools.partial(deliver_task, application.bot)
+    task_poller.start()
+    rate_limiter.start()
+    admin_cache.start(application.bot)
+    message_editor.start(application.bot)
+    await metrics_server.start()
+    await callback_receiver.start()
+    # Caches fill on demand; warming and cleanup happen once updates are flowing
+    lifecycle.warm_up(
+        rate_limiter.load,
+        video_cache.load,
+        functools.partial(task_manager.evict_expired, force=True),
+        functools.partial(video_processor.evict_expired, force=True),
+    )
+
+async def post_stop(application: Application) -> None:
+    """Stop taking new work and let deliveries under way finish while the bot can still send."""
+    lifecycle.begin_shutdown()
+    await lifecycle.stop()
+    await callback_receiver.stop(timeout=lifecycle.remaining())
+    await task_poller.stop(timeout=lifecycle.remaining())
+    await message_editor.stop()
+
+async def post_shutdown(application: Application) -> None:
+    """Flush state and release shared resources when the application stops."""
+    await metrics_server.stop()
+    video_processor.stop()
+    await rate_limiter.stop()
+    await admin_cache.stop()
+    if task_manager.store:
+        task_manager.store.close()
+    await task_manager.minimax_client.close()
+    logger.info("Shutdown complete")
 
 def main():
     """Entry point for the bot."""
     try:
         # Create and run application
-        app = (
+        builder = (
             Application.builder()
             .token(TELEGRAM_TOKEN)
-            .build()
+            .post_init(post_init)
+            .post_stop(post_stop)
+            .post_shutdown(post_shutdown)
+            # Different users' updates run in parallel, each user's in order
+            .concurrent_updates(update_processor)
         )
+        if TELEGRAM_API_URL:
+            builder = (
+                builder
+                .base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot")
+                .base_file_url(f"{TELEGRAM_API_URL.rstrip('/')}/file/bot")
+                .local_mode(TELEGRAM_LOCAL_MODE)
+            )
+        app = builder.build()
         
         # Add handlers
         app.add_handler(CommandHandler("start", start))
         app.add_handler(CommandHandler("help", help_command))
-        app.add_handler(CommandHandler("cat", cat_command))
+        # These detach from the update processor once their checks have run,
+        # so a /cat waiting in the generation queue doesn't hold a slot
+        app.add_handler(CommandHandler("cat", lifecycle.bounded(cat_command)))
+        app.add_handler(CommandHandler("batch", lifecycle.bounded(batch_command)))
         app.add_handler(CommandHandler("status", status_command))
+        # Admin changes take effect at once instead of after ADMIN_CACHE_TTL
+        app.add_handler(ChatMemberHandler(chat_member_update, ChatMemberHandler.CHAT_MEMBER))
         
+        def stop() -> None:
+            if app.running:
+                app.stop_running()
+            else:
+                # stop_running() does nothing before the application has started
+                raise SystemExit
+
+        # Stop signals first turn away new work, then stop the application
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        lifecycle.handle_signals(loop, stop)
+
         # Start the bot
-        print("Starting bot...")
-        app.run_polling()
+        if WEBHOOK_URL:
+            logger.info("Starting bot with webhook on %s:%d/%s", WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH)
+            app.run_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=ALLOWED_UPDATES,
+                stop_signals=None,
+            )
+        else:
+            logger.info("Starting bot")
+            app.run_polling(allowed_updates=ALLOWED_UPDATES, stop_signals=None)
         
     except KeyboardInterrupt:
-        print("\nBot stopped by user")
+        logger.info("Bot stopped by user")
     except Exception as e:
-        print(f"\nError: {e}")
+        logger.exception("Bot stopped with an error: %s", e)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,134 @@
+import os
+import hmac
+import json
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+from urllib.parse import urlencode
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Public URL Minimax should call (e.g. https://bot.example.com/minimax-callback);
+# leave unset to find completions by polling only
+CALLBACK_URL = os.getenv('MINIMAX_CALLBACK_URL')
+CALLBACK_LISTEN = os.getenv('MINIMAX_CALLBACK_LISTEN', '127.0.0.1')
+CALLBACK_PORT = int(os.getenv('MINIMAX_CALLBACK_PORT', '8090'))
+CALLBACK_PATH = os.getenv('MINIMAX_CALLBACK_PATH', '/minimax-callback')
+# Shared secret carried in the callback URL's query string; Minimax signs nothing
+CALLBACK_SECRET = os.getenv('MINIMAX_CALLBACK_SECRET')
+# Number of (task_id, status) notifications remembered for deduplication
+CALLBACK_DEDUP_SIZE = 10000
+
+# Called with (task_id, status, file_id) for each new notification
+StatusCallback = Callable[[str, str, Optional[str]], Awaitable[None]]
+
+class CallbackReceiver:
+    """
+    HTTP endpoint receiving Minimax task status notifications.
+
+    Answers Minimax's challenge request when the callback URL is registered,
+    rejects requests without the shared secret, drops repeated notifications
+    and hands each new one to `on_status` without making Minimax wait for it.
+    """
+
+    def __init__(
+        self,
+        on_status: StatusCallback,
+        url: Optional[str] = CALLBACK_URL,
+        secret: Optional[str] = CALLBACK_SECRET,
+        host: str = CALLBACK_LISTEN,
+        port: int = CALLBACK_PORT,
+        path: str = CALLBACK_PATH,
+    ):
+        if url and not secret:
+            raise ValueError("MINIMAX_CALLBACK_SECRET must be set when MINIMAX_CALLBACK_URL is")
+        self.on_status = on_status
+        self.url = url
+        self.secret = secret
+        self.host = host
+        self.port = port
+        self.path = path
+        self._seen: 'OrderedDict[Tuple[str, str], None]' = OrderedDict()
+        self._handlers: set = set()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    @property
+    def callback_url(self) -> Optional[str]:
+        """The URL to register with Minimax, including the secret."""
+        if not self.url:
+            return None
+        separator = '&' if '?' in self.url else '?'
+        return f"{self.url}{separator}{urlencode({'token': self.secret})}"
+
+    def _is_duplicate(self, task_id: str, status: str) -> bool:
+        key = (task_id, status)
+        if key in self._seen:
+            return True
+        self._seen[key] = None
+        while len(self._seen) > CALLBACK_DEDUP_SIZE:
+            self._seen.popitem(last=False)
+        return False
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        token = request.query.get('token', '')
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            return web.Response(status=403)
+        try:
+            body = json.loads(await request.text())
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(body, dict):
+            return web.Response(status=400)
+
+        if 'challenge' in body:
+            # Minimax checks the URL by expecting its challenge echoed back
+            return web.json_response({'challenge': body['challenge']})
+
+        task_id = body.get('task_id')
+        status = body.get('status')
+        if not task_id or not status:
+            return web.Response(status=400)
+        if self._is_duplicate(str(task_id), status):
+            return web.json_response({'ok': True})
+
+        logger.debug("Callback for task %s: %s", task_id, status)
+        handler = asyncio.create_task(self._dispatch(str(task_id), status, body.get('file_id') or None))
+        self._handlers.add(handler)
+        handler.add_done_callback(self._handlers.discard)
+        return web.json_response({'ok': True})
+
+    async def _dispatch(self, task_id: str, status: str, file_id: Optional[str]) -> None:
+        try:
+            await self.on_status(task_id, status, file_id)
+        except Exception as e:
+            logger.error("Handling callback for task %s failed: %s", task_id, e)
+
+    async def start(self) -> None:
+        """Start listening, unless no callback URL is configured."""
+        if not self.enabled or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_post(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Receiving Minimax callbacks on %s:%d%s", self.host, self.port, self.path)
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop listening and wait up to `timeout` seconds for notifications being handled."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._handlers:
+            await asyncio.wait(list(self._handlers), timeout=timeout)
+        handlers = list(self._handlers)
+        for handler in handlers:
+            handler.cancel()
+        await asyncio.gather(*handlers, return_exceptions=True)
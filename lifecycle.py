@@ -0,0 +1,126 @@
+import os
+import time
+import signal
+import asyncio
+import logging
+import functools
+from typing import Any, Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Time allowed for deliveries under way to finish once shutdown starts (seconds)
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '30'))
+
+class Lifecycle:
+    """
+    Startup warm-up and orderly shutdown of the bot.
+
+    On a stop signal the bot stops accepting new work (`accepting` turns
+    False and the registered shutdown callbacks run), then components get
+    until the shutdown deadline to finish what is under way before state
+    is flushed. Handlers wrapped with `bounded()` are cancelled at the
+    deadline, and a second signal exits at once. At startup, caches and
+    pending work are restored by `warm_up()` in the background so the
+    first update isn't kept waiting.
+    """
+
+    def __init__(self, timeout: float = SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self.accepting = True
+        self._deadline: Optional[float] = None
+        self._on_shutdown: List[Callable[[], None]] = []
+        self._warmup: Optional[asyncio.Task] = None
+        self._work: set = set()
+        self._cut: set = set()
+
+    def on_shutdown(self, callback: Callable[[], None]) -> None:
+        """Register a callback run once when shutdown begins."""
+        self._on_shutdown.append(callback)
+
+    def begin_shutdown(self) -> None:
+        """Stop accepting new work and start the shutdown deadline. Idempotent."""
+        if not self.accepting:
+            return
+        self.accepting = False
+        self._deadline = time.monotonic() + self.timeout
+        asyncio.get_running_loop().call_later(self.timeout, self._cut_work)
+        for callback in self._on_shutdown:
+            try:
+                callback()
+            except Exception as e:
+                logger.error("Shutdown callback failed: %s", e)
+
+    def remaining(self) -> float:
+        """Seconds left before the shutdown deadline."""
+        if self._deadline is None:
+            return self.timeout
+        return max(0.0, self._deadline - time.monotonic())
+
+    def _cut_work(self) -> None:
+        work = [task for task in self._work if not task.done()]
+        if work:
+            logger.warning("Shutdown deadline reached, cancelling %d handlers", len(work))
+        for task in work:
+            self._cut.add(task)
+            task.cancel()
+
+    def bounded(self, handler: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """
+        Wrap a handler so that it is cancelled if still running at the shutdown deadline.
+
+        Application.stop() waits for running handlers without a timeout. The
+        handler runs in a task of its own, so cancelling it leaves the
+        application's own update bookkeeping intact.
+        """
+        @functools.wraps(handler)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            work = asyncio.ensure_future(handler(*args, **kwargs))
+            self._work.add(work)
+            try:
+                return await work
+            except asyncio.CancelledError:
+                if work not in self._cut:
+                    raise  # the caller itself was cancelled
+                return None
+            finally:
+                self._work.discard(work)
+                self._cut.discard(work)
+        return wrapper
+
+    def handle_signals(self, loop: asyncio.AbstractEventLoop, stop: Callable[[], None]) -> None:
+        """On SIGINT/SIGTERM, stop accepting work and then call `stop`; a second signal exits at once."""
+        def on_signal(signum: int) -> None:
+            if not self.accepting:
+                logger.warning("Received %s again, exiting without waiting", signal.Signals(signum).name)
+                raise SystemExit(1)
+            logger.info("Received %s, shutting down", signal.Signals(signum).name)
+            self.begin_shutdown()
+            stop()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, on_signal, signum)
+            except NotImplementedError:
+                # Windows event loops don't support signal handlers; Ctrl+C still interrupts
+                return
+
+    def warm_up(self, *steps: Callable[[], object]) -> None:
+        """Run startup steps in the background, yielding to the event loop between them."""
+        async def run() -> None:
+            started = time.perf_counter()
+            for step in steps:
+                await asyncio.sleep(0)
+                try:
+                    step()
+                except Exception as e:
+                    logger.error("Warm-up step %s failed: %s", getattr(step, '__qualname__', step), e)
+            logger.info("Warm-up finished in %.3fs", time.perf_counter() - started)
+
+        self._warmup = asyncio.create_task(run())
+
+    async def stop(self) -> None:
+        """Cancel the warm-up if it is still running."""
+        if self._warmup is not None:
+            self._warmup.cancel()
+            await asyncio.gather(self._warmup, return_exceptions=True)
+            self._warmup = None
@@ -0,0 +1,53 @@
+import json
+import logging
+from datetime import datetime, timezone
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def _timestamp(record: logging.LogRecord) -> str:
+    return datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log collectors that parse JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': _timestamp(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class KeyValueFormatter(logging.Formatter):
+    """logfmt-style key=value lines; values containing spaces or quotes are quoted."""
+
+    @staticmethod
+    def _value(value: str) -> str:
+        if value and not any(c in value for c in ' "=\n'):
+            return value
+        return json.dumps(value, ensure_ascii=False)
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = [
+            ('time', _timestamp(record)),
+            ('level', record.levelname),
+            ('logger', record.name),
+            ('msg', record.getMessage()),
+        ]
+        if record.exc_info:
+            fields.append(('exc_info', self.formatException(record.exc_info)))
+        return ' '.join(f"{key}={self._value(value)}" for key, value in fields)
+
+def make_formatter(name: str) -> logging.Formatter:
+    """Formatter for LOG_FORMAT: 'text' (default), 'json' or 'kv'."""
+    name = name.lower()
+    if name == 'json':
+        return JsonFormatter()
+    if name in ('kv', 'logfmt'):
+        return KeyValueFormatter()
+    if name != 'text':
+        logging.getLogger(__name__).warning("Unknown LOG_FORMAT %r, using text", name)
+    return logging.Formatter(TEXT_FORMAT)
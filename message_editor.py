@@ -0,0 +1,125 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Minimum time between two edits in the same chat (seconds)
+EDIT_CHAT_INTERVAL = float(os.getenv('EDIT_CHAT_INTERVAL', '3'))
+# Edits per second across all chats, below Telegram's ~30 messages/s bot limit
+EDIT_GLOBAL_RATE = float(os.getenv('EDIT_GLOBAL_RATE', '20'))
+
+MessageKey = Tuple[int, int]
+
+class MessageEditor:
+    """
+    Edit messages in place with coalescing and flood-limit throttling.
+
+    edit() only records the latest text wanted for a message. A background
+    task applies it once the chat's EDIT_CHAT_INTERVAL has passed, so a
+    burst of status changes becomes a single edit. Telegram's RetryAfter
+    pushes back the whole chat.
+    """
+
+    def __init__(self, chat_interval: float = EDIT_CHAT_INTERVAL, global_rate: float = EDIT_GLOBAL_RATE):
+        self.chat_interval = chat_interval
+        self.global_interval = 1 / global_rate
+        self._bot: Optional[Bot] = None
+        # (chat_id, message_id) -> (text, parse_mode) still to be applied
+        self._pending: Dict[MessageKey, Tuple[str, Optional[str]]] = {}
+        self._schedule: List[Tuple[float, MessageKey]] = []  # heap of (due time, key)
+        self._chat_next: Dict[int, float] = {}
+        self._last_edit = 0.0
+        self._wakeup = asyncio.Event()
+        self._runner: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Edits waiting to be applied."""
+        return len(self._pending)
+
+    def edit(self, chat_id: int, message_id: int, text: str, parse_mode: Optional[str] = None) -> None:
+        """Set a message's text, replacing any edit to it not yet applied."""
+        key = (chat_id, message_id)
+        queued = key in self._pending
+        self._pending[key] = (text, parse_mode)
+        if not queued:
+            due = max(time.monotonic(), self._chat_next.get(chat_id, 0.0))
+            heapq.heappush(self._schedule, (due, key))
+            self._wakeup.set()
+
+    def start(self, bot: Bot) -> None:
+        """Start applying edits in the background."""
+        self._bot = bot
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task, then apply whatever is still pending."""
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        while self._schedule:
+            _, key = heapq.heappop(self._schedule)
+            await self._apply(key)
+
+    async def _run(self) -> None:
+        while True:
+            if not self._schedule:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            due, key = self._schedule[0]
+            # Never faster than the global rate, whatever the chats allow
+            due = max(due, self._last_edit + self.global_interval)
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._schedule)
+            chat_next = self._chat_next.get(key[0], 0.0)
+            if chat_next > time.monotonic():
+                # Another message in this chat was edited since this one was queued
+                heapq.heappush(self._schedule, (chat_next, key))
+                continue
+            await self._apply(key)
+
+    async def _apply(self, key: MessageKey) -> None:
+        pending = self._pending.pop(key, None)
+        if pending is None or self._bot is None:
+            return
+        chat_id, message_id = key
+        text, parse_mode = pending
+        now = time.monotonic()
+        self._last_edit = now
+        self._chat_next[chat_id] = now + self.chat_interval
+        try:
+            await self._bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, parse_mode=parse_mode)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else e.retry_after
+            logger.warning("Edit flood limit in chat %s, waiting %ss", chat_id, retry_after)
+            self._chat_next[chat_id] = time.monotonic() + retry_after
+            # Retry unless a newer text has been queued meanwhile
+            if key not in self._pending:
+                self._pending[key] = pending
+                heapq.heappush(self._schedule, (self._chat_next[chat_id], key))
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.warning("Could not edit message %s in chat %s: %s", message_id, chat_id, e)
+        except TelegramError as e:
+            logger.warning("Could not edit message %s in chat %s: %s", message_id, chat_id, e)
+
+        if len(self._chat_next) > 10000:
+            # Forget chats whose throttle has long expired
+            self._chat_next = {chat: at for chat, at in self._chat_next.items() if at > now}
@@ -0,0 +1,269 @@
+import os
+import time
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Serve /metrics on this port; 0 disables the endpoint (metrics are still kept)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Latency buckets in seconds, from fast API calls up to slow video transfers
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from `function` at scrape time instead of tracking it."""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child: '_HistogramChild'):
+        self.child = child
+
+    def __enter__(self) -> '_Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.child.observe(time.perf_counter() - self.started)
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # Per-bucket (not cumulative) counts; the last slot is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        """Context manager observing the duration of its block."""
+        return _Timer(self)
+
+class Metric:
+    """A named metric family, optionally split by label values."""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional['Registry'] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """The child metric for one combination of label values."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples(),
+        ]
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+class Gauge(Metric):
+    """Value that can go up and down, or be read from a callback at scrape time."""
+
+    kind = 'gauge'
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self.labels().set_function(function)
+
+    def _samples(self) -> List[str]:
+        samples = []
+        for values, child in list(self._children.items()):
+            try:
+                value = child.get()
+            except Exception as e:
+                logger.warning("Gauge %s callback failed: %s", self.name, e)
+                continue
+            samples.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return samples
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional['Registry'] = None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _samples(self) -> List[str]:
+        samples = []
+        names = self.labelnames + ('le',)
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float('inf'),), child.counts):
+                cumulative += count
+                labels = _format_labels(names, values + (_format_value(bound),))
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            samples.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+        return samples
+
+class Registry:
+    """The set of metrics exposed together."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> None:
+        if any(existing.name == metric.name for existing in self._metrics):
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+class MetricsServer:
+    """Serve a registry at /metrics over HTTP."""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.registry.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    async def start(self) -> None:
+        """Start listening, unless the port is 0."""
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Serving metrics on http://%s:%d/metrics", self.host, self.port)
+
+    async def stop(self) -> None:
+        """Stop listening."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Metrics shared across modules
+UPSTREAM_LATENCY = Histogram(
+    'minimax_request_seconds', 'Latency of one Minimax API attempt or video download.',
+    ('operation',),
+)
+UPSTREAM_RETRIES = Counter(
+    'minimax_retries', 'Minimax calls retried after a failed attempt.', ('operation',),
+)
+TELEGRAM_UPLOAD_LATENCY = Histogram(
+    'telegram_send_video_seconds', 'Time to send a video to Telegram.', ('source',),
+)
+RATE_LIMIT_REJECTIONS = Counter('rate_limit_rejections', 'Requests refused by the rate limiter.')
+GENERATION_OUTCOMES = Counter('generations', 'Generations by final outcome.', ('outcome',))
+TASKS_IN_FLIGHT = Gauge('generations_in_flight', 'Generations submitted and not yet finished.')
+TASKS_QUEUED = Gauge('generations_queued', 'Generation submits waiting for a scheduler slot.')
+POLLER_DEPTH = Gauge('poller_watched_tasks', 'Tasks the status poller is watching.')
+VIDEO_PROCESSING_LATENCY = Histogram('video_processing_seconds', 'Time to post-process a downloaded video.')
@@ -1,25 +1,310 @@
 import os
+import re
 import time
 import json
+import asyncio
 import random
 import base64
-import requests
-from typing import Tuple, Optional
-from dotenv import load_dotenv
+import struct
+import logging
+import aiohttp
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List, Tuple, Optional
 
-load_dotenv()
+from metrics import UPSTREAM_LATENCY, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
 
 API_KEY = os.getenv('MINIMAX_API_KEY')
 GROUP_ID = os.getenv('MINIMAX_GROUP_ID')
 API_SERVICE_URL = os.getenv('AI_SERVICE_URL', 'https://api.minimaxi.chat/v1')
 ASSETS_DIR = os.path.join(os.path.dirname(__file__), 'assets')
 
+# HTTP transport settings (seconds / connection counts)
+REQUEST_TIMEOUT = float(os.getenv('MINIMAX_REQUEST_TIMEOUT', '30'))
+CONNECT_TIMEOUT = float(os.getenv('MINIMAX_CONNECT_TIMEOUT', '10'))
+DOWNLOAD_TIMEOUT = float(os.getenv('MINIMAX_DOWNLOAD_TIMEOUT', '300'))
+MAX_CONNECTIONS = int(os.getenv('MINIMAX_MAX_CONNECTIONS', '20'))
+KEEPALIVE_TIMEOUT = float(os.getenv('MINIMAX_KEEPALIVE_TIMEOUT', '30'))
+
+# Video downloads are streamed to disk in chunks of this size (bytes)
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('MINIMAX_DOWNLOAD_CHUNK_SIZE', str(256 * 1024)))
+DOWNLOAD_MAX_ATTEMPTS = int(os.getenv('MINIMAX_DOWNLOAD_MAX_ATTEMPTS', '3'))
+
+# Retries: exponential backoff with full jitter, capped at RETRY_MAX_DELAY. A
+# Retry-After longer than RETRY_MAX_DELAY is not waited out; the error is raised at once
+RETRY_MAX_ATTEMPTS = int(os.getenv('MINIMAX_RETRY_MAX_ATTEMPTS', '4'))
+RETRY_BASE_DELAY = float(os.getenv('MINIMAX_RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.getenv('MINIMAX_RETRY_MAX_DELAY', '30'))
+# Circuit breaker: open after this many consecutive failures, probe again after the timeout
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('MINIMAX_BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('MINIMAX_BREAKER_RESET_TIMEOUT', '30'))
+# Number of recent submit idempotency keys remembered
+SUBMIT_GUARD_SIZE = 1000
+
+# Minimax base_resp status codes that are transient
+API_RATE_LIMITED = 1002
+API_INTERNAL_ERROR = 1013
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+# Called with (bytes_downloaded, total_bytes or None) after each chunk
+ProgressCallback = Callable[[int, Optional[int]], None]
+
 # These images have dimensions >= 300px on both sides
 VALID_CAT_IMAGES = [
     'Untitled.jpg',
     
 ]
 
+# Minimax first_frame_image requirements
+MIN_IMAGE_SIDE = 300
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MIN_ASPECT_RATIO = 2 / 5
+MAX_ASPECT_RATIO = 5 / 2
+# How often asset files are checked for changes (seconds)
+IMAGE_RECHECK_INTERVAL = float(os.getenv('IMAGE_RECHECK_INTERVAL', '5'))
+
+class MinimaxError(Exception):
+    """
+    A failed Minimax API call.
+
+    Attributes:
+        status: HTTP status, if a response was received
+        retry_after: Seconds the server asked us to wait, if any
+        ambiguous: True if the request may have been processed despite the error
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        ambiguous: bool = False,
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.ambiguous = ambiguous
+
+class MinimaxRateLimitError(MinimaxError):
+    """Minimax rejected the call with 429 or a rate limit status code."""
+
+class CircuitOpenError(MinimaxError):
+    """The circuit breaker is open; the call was not attempted."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(
+            f"Minimax API temporarily unavailable, retry in {int(retry_after) + 1} seconds",
+            status=503,
+            retry_after=retry_after,
+        )
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given as seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter, never shorter than Retry-After.
+
+    Callers don't retry when Retry-After exceeds RETRY_MAX_DELAY, so the
+    result is at most RETRY_MAX_DELAY.
+    """
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1))))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+class CircuitBreaker:
+    """
+    Fail fast while the upstream is unhealthy.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls are rejected for `reset_timeout` seconds. Then a single probe is
+    let through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half_open'."""
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call should not be attempted."""
+        state = self.state
+        if state == 'closed':
+            return
+        now = time.monotonic()
+        # One probe at a time; a probe that never reported back is replaced
+        if state == 'half_open' and (
+            self._probe_started is None or now - self._probe_started >= self.reset_timeout
+        ):
+            self._probe_started = now
+            return
+        remaining = self.reset_timeout - (now - self.opened_at)
+        raise CircuitOpenError(max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        """Close the circuit after a healthy response."""
+        if self.opened_at is not None:
+            logger.info("Minimax circuit breaker closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        """Count a failure, opening the circuit at the threshold or on a failed probe."""
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Minimax circuit breaker opened after %d failures", self.failures)
+            self.opened_at = time.monotonic()
+            self._probe_started = None
+
+def read_image_info(data: bytes) -> Tuple[str, int, int]:
+    """
+    Read the MIME type and pixel size of a JPEG or PNG image from its header.
+
+    Returns:
+        Tuple[str, int, int]: (mime_type, width, height)
+
+    Raises:
+        ValueError: If the data isn't a JPEG or PNG image
+    """
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', data[16:24])
+        return 'image/png', width, height
+
+    if data[:2] == b'\xff\xd8':
+        offset = 2
+        while offset + 4 <= len(data):
+            if data[offset] != 0xFF:
+                break
+            marker = data[offset + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                offset += 2
+                continue
+            (length,) = struct.unpack('>H', data[offset + 2:offset + 4])
+            # SOFn frames carry the image size; C4/C8/CC are other tables
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+                return 'image/jpeg', width, height
+            offset += 2 + length
+
+    raise ValueError("Unsupported image format; expected JPEG or PNG")
+
+class ReferenceImages:
+    """
+    Validated, pre-encoded reference images for the first_frame_image field.
+
+    Each image is read and base64-encoded once and kept as the serialized
+    tail of the request body, so submitting a task only has to encode the
+    prompt. Files are re-read when their modification time changes.
+    """
+
+    def __init__(self, assets_dir: str = ASSETS_DIR, filenames: List[str] = VALID_CAT_IMAGES):
+        self.assets_dir = assets_dir
+        self.filenames = filenames
+        self._payload_tails: List[bytes] = []
+        self._mtimes: Dict[str, float] = {}
+        self._last_check = 0.0
+        self.reload()
+
+    def _current_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for name in self.filenames:
+            try:
+                mtimes[name] = os.stat(os.path.join(self.assets_dir, name)).st_mtime
+            except OSError:
+                continue
+        return mtimes
+
+    def _encode(self, name: str) -> Optional[bytes]:
+        """Validate an image and return its serialized payload tail, or None if unusable."""
+        path = os.path.join(self.assets_dir, name)
+        try:
+            with open(path, 'rb') as image_file:
+                data = image_file.read()
+            mime_type, width, height = read_image_info(data)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning("Skipping reference image %s: %s", name, e)
+            return None
+
+        if len(data) > MAX_IMAGE_BYTES:
+            logger.warning("Skipping reference image %s: larger than %d bytes", name, MAX_IMAGE_BYTES)
+            return None
+        if min(width, height) < MIN_IMAGE_SIDE:
+            logger.warning("Skipping reference image %s: %dx%d is below %dpx", name, width, height, MIN_IMAGE_SIDE)
+            return None
+        if not MIN_ASPECT_RATIO < width / height < MAX_ASPECT_RATIO:
+            logger.warning("Skipping reference image %s: aspect ratio %dx%d out of range", name, width, height)
+            return None
+
+        image_base64 = base64.b64encode(data).decode('ascii')
+        tail = json.dumps({
+            "model": "video-01",
+            "prompt_optimizer": True,
+            "first_frame_image": f"data:{mime_type};base64,{image_base64}",
+        })
+        # Drop the opening brace so the tail can follow the prompt field
+        return b', ' + tail[1:].encode('ascii')
+
+    def reload(self) -> None:
+        """Validate and encode every reference image."""
+        mtimes = self._current_mtimes()
+        tails = [tail for tail in (self._encode(name) for name in mtimes) if tail]
+        if not tails:
+            raise ValueError(f"No valid reference images found in {self.assets_dir}")
+        self._payload_tails = tails
+        self._mtimes = mtimes
+        self._last_check = time.monotonic()
+
+    def _reload_if_changed(self) -> None:
+        now = time.monotonic()
+        if now - self._last_check < IMAGE_RECHECK_INTERVAL:
+            return
+        self._last_check = now
+        if self._current_mtimes() != self._mtimes:
+            try:
+                self.reload()
+            except ValueError as e:
+                # Keep serving the previous images rather than failing submits
+                logger.error("Reference image reload failed: %s", e)
+
+    def build_payload(self, prompt: str, callback_url: Optional[str] = None) -> bytes:
+        """Build a video_generation request body with a random reference image."""
+        self._reload_if_changed()
+        head = b'{"prompt": ' + json.dumps(prompt).encode('ascii')
+        if callback_url:
+            head += b', "callback_url": ' + json.dumps(callback_url).encode('ascii')
+        return head + random.choice(self._payload_tails)
+
 class MinimaxClient:
     def __init__(self):
         self.api_key = API_KEY
@@ -33,65 +318,189 @@ class MinimaxClient:
             'authorization': f'Bearer {self.api_key}',
             'content-type': 'application/json',
         }
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT)
+        self._download_timeout = aiohttp.ClientTimeout(
+            total=DOWNLOAD_TIMEOUT, connect=CONNECT_TIMEOUT
+        )
+        self.reference_images = ReferenceImages()
+        self.breaker = CircuitBreaker()
+        # Idempotency key -> submit future, so a replayed submit can't charge twice
+        self._submits: 'OrderedDict[str, asyncio.Future]' = OrderedDict()
+        # Where Minimax should push status changes of submitted tasks, if anywhere
+        self.callback_url: Optional[str] = None
 
-    def get_random_cat_image_base64(self) -> str:
-        """Get a random cat image as base64."""
-        image_path = os.path.join(ASSETS_DIR, random.choice(VALID_CAT_IMAGES))
-        with open(image_path, 'rb') as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+    async def start(self) -> None:
+        """Open the shared HTTP session. Must be called from within the event loop."""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self._timeout,
+        )
 
-    async def generate_video(self, prompt: str) -> str:
-        """Submit a video generation task."""
-        url = f"{API_SERVICE_URL}/video_generation"
-        
-        # Get a random cat image
-        cat_image_base64 = self.get_random_cat_image_base64()
-        
-        payload = json.dumps({
-            "prompt": prompt,
-            "model": "video-01",
-            "prompt_optimizer": True,
-            "first_frame_image": f"data:image/png;base64,{cat_image_base64}"
-        })
+    async def close(self) -> None:
+        """Close the shared HTTP session and release pooled connections."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, opening it lazily if start() wasn't called."""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def _request(self, operation: str, method: str, url: str, idempotent: bool, **kwargs: Any) -> Dict:
+        """
+        Make an API call with retries and the circuit breaker.
+
+        `operation` names the call in metrics (submit, status, retrieve).
+
+        Idempotent calls are retried on connection errors, timeouts, 429 and
+        5xx responses. Non-idempotent calls (submit) are only retried when
+        the server can't have acted on them: the connection was never made,
+        or the response was 429 or 503.
+
+        Returns:
+            Dict: The decoded JSON response body
+
+        Raises:
+            MinimaxError: If the call failed and retries were exhausted or unsafe
+        """
+        session = await self._ensure_session()
+        latency = UPSTREAM_LATENCY.labels(operation)
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            self.breaker.before_call()
+            body = None
+            try:
+                with latency.time():
+                    async with session.request(method, url, headers=self.headers, **kwargs) as response:
+                        status = response.status
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                        body = await response.text()
+            except aiohttp.ClientConnectorError as e:
+                # The request never reached the server, so retrying is always safe
+                error = MinimaxError(f"Connection to Minimax failed: {e}")
+                retryable = True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = MinimaxError(f"Minimax request failed: {e!r}", ambiguous=not idempotent)
+                retryable = idempotent
+            else:
+                try:
+                    data = json.loads(body) if body else {}
+                except ValueError:
+                    data = {}
+                api_code = (data.get('base_resp') or {}).get('status_code', 0) if isinstance(data, dict) else 0
+
+                if status == 429 or api_code == API_RATE_LIMITED:
+                    error = MinimaxRateLimitError(
+                        f"Minimax rate limit: HTTP {status}, code {api_code}",
+                        status=429, retry_after=retry_after,
+                    )
+                    retryable = True
+                elif status >= 500 or api_code == API_INTERNAL_ERROR:
+                    error = MinimaxError(
+                        f"Minimax server error: HTTP {status}, code {api_code}: {body}",
+                        status=status if status >= 500 else 500,
+                        retry_after=retry_after,
+                        ambiguous=not idempotent and status != 503,
+                    )
+                    retryable = idempotent or status == 503
+                elif status >= 400:
+                    # The upstream is healthy; the request itself was rejected
+                    self.breaker.record_success()
+                    raise MinimaxError(f"Minimax request rejected: HTTP {status}: {body}", status=status)
+                else:
+                    self.breaker.record_success()
+                    return data
+
+            self.breaker.record_failure()
+            if error.retry_after is not None and error.retry_after > RETRY_MAX_DELAY:
+                # Don't hold the caller for however long the server asked; the
+                # error carries retry_after for it to act on
+                retryable = False
+            if not retryable or attempt == RETRY_MAX_ATTEMPTS:
+                logger.error("Minimax %s %s failed: %s", method, url, error)
+                raise error
+            delay = backoff_delay(attempt, error.retry_after)
+            UPSTREAM_RETRIES.labels(operation).inc()
+            logger.warning("Minimax %s %s failed (%s); retry %d in %.1fs", method, url, error, attempt, delay)
+            await asyncio.sleep(delay)
+
+    async def generate_video(self, prompt: str, idempotency_key: Optional[str] = None) -> str:
+        """
+        Submit a video generation task.
+
+        Args:
+            prompt: Generation prompt
+            idempotency_key: Optional key identifying the request; repeating a
+                key returns the original task_id instead of submitting again
+
+        Returns:
+            str: The Minimax task_id
+        """
+        if idempotency_key is None:
+            return await self._submit(prompt)
 
+        existing = self._submits.get(idempotency_key)
+        if existing is not None:
+            return await asyncio.shield(existing)
+
+        future = asyncio.get_running_loop().create_future()
+        self._submits[idempotency_key] = future
+        while len(self._submits) > SUBMIT_GUARD_SIZE:
+            self._submits.popitem(last=False)
         try:
-            response = requests.post(url, headers=self.headers, data=payload)
-            response.raise_for_status()
-            response_data = response.json()
-            
-            if 'task_id' not in response_data:
-                raise Exception(f"No task_id in response: {response_data}")
-                
-            return response_data['task_id']
+            task_id = await self._submit(prompt)
+        except asyncio.CancelledError:
+            # Don't leave replays waiting on a submit nobody will finish; a later
+            # replay may submit again
+            future.set_exception(MinimaxError("Submit was cancelled"))
+            future.exception()
+            if self._submits.get(idempotency_key) is future:
+                del self._submits[idempotency_key]
+            raise
         except Exception as e:
-            print(f"Error in generate_video: {str(e)}")
-            print(f"Response content: {response.text if 'response' in locals() else 'No response'}")
+            future.set_exception(e)
+            future.exception()  # waiters still see it; don't warn if there are none
+            if not getattr(e, 'ambiguous', False) and self._submits.get(idempotency_key) is future:
+                # Definitely not processed: the same request may be submitted again
+                del self._submits[idempotency_key]
             raise
+        future.set_result(task_id)
+        return task_id
+
+    async def _submit(self, prompt: str) -> str:
+        url = f"{API_SERVICE_URL}/video_generation"
+        
+        # Reference images are pre-encoded; only the prompt is serialized here
+        payload = self.reference_images.build_payload(prompt, self.callback_url)
+
+        response_data = await self._request('submit', 'POST', url, idempotent=False, data=payload)
+        if 'task_id' not in response_data:
+            raise MinimaxError(f"No task_id in response: {response_data}")
+            
+        return response_data['task_id']
 
     async def check_generation_status(self, task_id: str) -> Tuple[str, str]:
         """Check the status of a video generation task."""
         url = f"{API_SERVICE_URL}/query/video_generation"
         params = {'task_id': task_id}
         
-        try:
-            response = requests.get(url, headers=self.headers, params=params)
-            response.raise_for_status()
-            response_data = response.json()
-            
-            if 'status' not in response_data:
-                raise Exception(f"No status in response: {response_data}")
-            
-            status = response_data.get('status', 'Unknown')
-            file_id = response_data.get('file_id', '')
-            
-            # Print response for debugging
-            print(f"Status check response: {response_data}")
-            
-            return status, file_id
-        except Exception as e:
-            print(f"Error in check_generation_status: {str(e)}")
-            print(f"Response content: {response.text if 'response' in locals() else 'No response'}")
-            raise
+        response_data = await self._request('status', 'GET', url, idempotent=True, params=params)
+        if 'status' not in response_data:
+            raise MinimaxError(f"No status in response: {response_data}")
+        
+        status = response_data.get('status', 'Unknown')
+        file_id = response_data.get('file_id', '')
+        logger.debug("Status check response: %s", response_data)
+        return status, file_id
 
     async def get_video_url(self, file_id: str) -> Optional[str]:
         """Get the download URL for a generated video."""
@@ -101,24 +510,89 @@ class MinimaxClient:
             'file_id': file_id
         }
         
-        response = requests.get(url, headers=self.headers, params=params)
-        response_data = response.json()
-        
-        if response.status_code != 200:
-            raise Exception(f"Failed to get video URL: {response_data.get('base_resp', {}).get('status_msg', 'Unknown error')}")
-            
+        response_data = await self._request('retrieve', 'GET', url, idempotent=True, params=params)
         return response_data.get('file', {}).get('download_url')
 
-    async def download_video(self, url: str, file_path: str) -> bool:
-        """Download a video file from the given URL."""
-        try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                with open(file_path, 'wb') as f:
-                    f.write(response.content)
-                return True
-            else:
-                print(f"Failed to download video: HTTP {response.status_code}")
-        except Exception as e:
-            print(f"Error downloading video: {e}")
+    async def download_video(
+        self,
+        url: str,
+        file_path: str,
+        progress_callback: Optional[ProgressCallback] = None,
+        max_attempts: int = DOWNLOAD_MAX_ATTEMPTS,
+    ) -> bool:
+        """
+        Stream a video file from the given URL to disk.
+
+        The body is written in DOWNLOAD_CHUNK_SIZE chunks so memory use stays
+        bounded regardless of video size. If the transfer is interrupted, the
+        next attempt resumes from the bytes already on disk with an HTTP Range
+        request; servers that ignore Range restart the file from scratch.
+
+        Args:
+            url: Download URL returned by get_video_url
+            file_path: Destination path; existing partial content is resumed
+            progress_callback: Optional callable receiving (downloaded, total)
+            max_attempts: Number of connection attempts before giving up
+
+        Returns:
+            bool: True if the full file was written
+        """
+        with UPSTREAM_LATENCY.labels('download').time():
+            return await self._download(url, file_path, progress_callback, max_attempts)
+
+    async def _download(
+        self,
+        url: str,
+        file_path: str,
+        progress_callback: Optional[ProgressCallback],
+        max_attempts: int,
+    ) -> bool:
+        session = await self._ensure_session()
+        for attempt in range(1, max_attempts + 1):
+            if attempt > 1:
+                UPSTREAM_RETRIES.labels('download').inc()
+            offset = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            # The download URL is pre-signed, so no API headers are sent to the file host
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            try:
+                async with session.get(url, headers=headers, timeout=self._download_timeout) as response:
+                    if response.status == 416 and offset:
+                        # Nothing left to fetch: the previous attempt got everything
+                        return True
+                    if response.status == 206:
+                        match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+                        if not match or int(match.group(1)) != offset:
+                            logger.warning(
+                                "Unexpected Content-Range for resumed download: %s",
+                                response.headers.get('Content-Range'),
+                            )
+                            os.remove(file_path)
+                            continue
+                        total = int(match.group(3)) if match.group(3) != '*' else None
+                        mode = 'ab'
+                    elif response.status == 200:
+                        offset = 0
+                        total = response.content_length
+                        mode = 'wb'
+                    else:
+                        logger.error("Failed to download video: HTTP %d", response.status)
+                        return False
+
+                    with open(file_path, mode) as f:
+                        async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            offset += len(chunk)
+                            if progress_callback:
+                                progress_callback(offset, total)
+
+                    if total is None or offset >= total:
+                        return True
+                    logger.warning("Download ended early at %d/%d bytes", offset, total)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("Error downloading video (attempt %d/%d): %s", attempt, max_attempts, e)
+                if attempt < max_attempts:
+                    await asyncio.sleep(backoff_delay(attempt))
+            except OSError as e:
+                logger.error("Error writing video to %s: %s", file_path, e)
+                return False
         return False
@@ -0,0 +1,332 @@
+"""
+Local stand-ins for the Minimax video API and the Telegram Bot API.
+
+Used by benchmark.py, and runnable on its own for manual testing:
+
+    python mock_minimax.py --port 8099 --generation-time 20
+    AI_SERVICE_URL=http://127.0.0.1:8099/v1 TELEGRAM_API_URL=http://127.0.0.1:8099 python bot.py
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import itertools
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+class MockMinimax:
+    """
+    Minimax video generation endpoints with configurable behaviour.
+
+    Generations move Queueing -> Processing -> Success (or Fail) on a timer.
+    Every request waits `latency` seconds (jittered ±50%) and may be
+    answered with a 429 or a 500 at the configured rates. Submits carrying a
+    callback_url get status pushes there, after a one-time challenge.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        failure_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        generation_time: float = 2.0,
+        generation_fail_rate: float = 0.0,
+        video_size: int = 1024 * 1024,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.generation_time = generation_time
+        self.generation_fail_rate = generation_fail_rate
+        self.video_size = video_size
+        self.requests: Counter = Counter()
+        # task_id -> (started_at, duration, final status)
+        self._tasks: Dict[str, Tuple[float, float, str]] = {}
+        self._ids = itertools.count(1)
+        self._chunk = b'\0' * DOWNLOAD_CHUNK_SIZE
+        self.base_url = ''
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._verified_callbacks: Dict[str, bool] = {}
+        self._pushes: set = set()
+
+    def add_routes(self, app: web.Application, prefix: str = '/v1') -> None:
+        app.router.add_post(f'{prefix}/video_generation', self._generate)
+        app.router.add_get(f'{prefix}/query/video_generation', self._query)
+        app.router.add_get(f'{prefix}/files/retrieve', self._retrieve)
+        app.router.add_get('/download/{file_id}', self._download)
+
+    async def _delay_or_fail(self, endpoint: str) -> Optional[web.Response]:
+        """Count the request, wait, and return an error response if one was drawn."""
+        self.requests[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        draw = random.random()
+        if draw < self.rate_limit_rate:
+            self.requests[f'{endpoint}_429'] += 1
+            return web.json_response(
+                {'base_resp': {'status_code': 1002, 'status_msg': 'rate limit'}},
+                status=429, headers={'Retry-After': '1'},
+            )
+        if draw < self.rate_limit_rate + self.failure_rate:
+            self.requests[f'{endpoint}_500'] += 1
+            return web.json_response(
+                {'base_resp': {'status_code': 1013, 'status_msg': 'internal error'}}, status=500
+            )
+        return None
+
+    async def _generate(self, request: web.Request) -> web.Response:
+        if 'authorization' not in request.headers:
+            return web.json_response({'base_resp': {'status_code': 1004}}, status=401)
+        error = await self._delay_or_fail('submit')
+        if error is not None:
+            return error
+        try:
+            callback_url = json.loads(await request.read()).get('callback_url')
+        except ValueError:
+            return web.json_response({'base_resp': {'status_code': 2013}}, status=400)
+        if callback_url and not await self._verify_callback(callback_url):
+            return web.json_response({'base_resp': {'status_code': 2013, 'status_msg': 'callback check failed'}})
+        task_id = str(next(self._ids)).zfill(18)
+        final = 'Fail' if random.random() < self.generation_fail_rate else 'Success'
+        duration = self.generation_time * random.uniform(0.5, 1.5)
+        self._tasks[task_id] = (time.monotonic(), duration, final)
+        if callback_url:
+            push = asyncio.create_task(self._push_statuses(callback_url, task_id, duration, final))
+            self._pushes.add(push)
+            push.add_done_callback(self._pushes.discard)
+        return web.json_response({'task_id': task_id, 'base_resp': {'status_code': 0}})
+
+    async def _post(self, url: str, body: Dict) -> Optional[Dict]:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=3))
+        try:
+            async with self._session.post(url, json=body) as response:
+                self.requests[f'callback_{response.status}'] += 1
+                return await response.json() if response.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            self.requests['callback_error'] += 1
+            return None
+
+    async def _verify_callback(self, url: str) -> bool:
+        if url not in self._verified_callbacks:
+            challenge = f'challenge{random.getrandbits(32)}'
+            reply = await self._post(url, {'challenge': challenge})
+            self._verified_callbacks[url] = bool(reply) and reply.get('challenge') == challenge
+        return self._verified_callbacks[url]
+
+    async def _push_statuses(self, url: str, task_id: str, duration: float, final: str) -> None:
+        await asyncio.sleep(duration / 4)
+        await self._post(url, {'task_id': task_id, 'status': 'Processing', 'base_resp': {'status_code': 0}})
+        await asyncio.sleep(duration * 3 / 4)
+        body = {'task_id': task_id, 'status': final, 'base_resp': {'status_code': 0}}
+        if final == 'Success':
+            body['file_id'] = f'file{task_id}'
+        await self._post(url, body)
+
+    async def close(self) -> None:
+        for push in list(self._pushes):
+            push.cancel()
+        await asyncio.gather(*self._pushes, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _status(self, task_id: str) -> Optional[str]:
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            return None
+        started_at, duration, final = entry
+        elapsed = time.monotonic() - started_at
+        if elapsed >= duration:
+            return final
+        return 'Queueing' if elapsed < duration / 4 else 'Processing'
+
+    async def _query(self, request: web.Request) -> web.Response:
+        error = await self._delay_or_fail('status')
+        if error is not None:
+            return error
+        task_id = request.query.get('task_id', '')
+        status = self._status(task_id)
+        if status is None:
+            return web.json_response({'base_resp': {'status_code': 2013, 'status_msg': 'task not found'}})
+        body = {'task_id': task_id, 'status': status, 'base_resp': {'status_code': 0}}
+        if status == 'Success':
+            body['file_id'] = f'file{task_id}'
+        return web.json_response(body)
+
+    async def _retrieve(self, request: web.Request) -> web.Response:
+        error = await self._delay_or_fail('retrieve')
+        if error is not None:
+            return error
+        file_id = request.query.get('file_id', '')
+        base_url = self.base_url or f'{request.scheme}://{request.host}'
+        return web.json_response({
+            'file': {'file_id': file_id, 'download_url': f'{base_url}/download/{file_id}.mp4'},
+            'base_resp': {'status_code': 0},
+        })
+
+    async def _download(self, request: web.Request) -> web.StreamResponse:
+        self.requests['download'] += 1
+        offset = 0
+        range_header = request.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            offset = int(range_header[6:].split('-')[0] or 0)
+            if offset >= self.video_size:
+                return web.Response(status=416)
+        response = web.StreamResponse(status=206 if offset else 200)
+        response.content_type = 'video/mp4'
+        response.content_length = self.video_size - offset
+        if offset:
+            response.headers['Content-Range'] = f'bytes {offset}-{self.video_size - 1}/{self.video_size}'
+        await response.prepare(request)
+        remaining = self.video_size - offset
+        while remaining > 0:
+            chunk = self._chunk[:min(remaining, DOWNLOAD_CHUNK_SIZE)]
+            await response.write(chunk)
+            remaining -= len(chunk)
+        self.requests['download_bytes'] += self.video_size - offset
+        return response
+
+class FakeTelegram:
+    """
+    The subset of the Bot API the bot calls, answering instantly.
+
+    Every call is counted; `on_video` is called with the chat_id of each
+    sendVideo so callers can time end-to-end delivery.
+    """
+
+    def __init__(self, token: str = 'TOKEN', on_video: Optional[Callable[[int], None]] = None):
+        self.token = token
+        self.on_video = on_video
+        self.requests: Counter = Counter()
+        self._message_ids = itertools.count(1000)
+
+    def add_routes(self, app: web.Application) -> None:
+        app.router.add_post(r'/bot{token}/{method}', self._handle)
+
+    def _message(self, chat_id: int, **fields) -> Dict:
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            **fields,
+        }
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.requests[method] += 1
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            # Form fields and multipart uploads; uploaded files are read and dropped
+            params = dict(await request.post())
+        chat_id = int(params.get('chat_id', 0) or 0)
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Mock', 'username': 'mock_bot'}
+        elif method == 'getChatAdministrators':
+            result = []
+        elif method == 'sendVideo':
+            message_id = next(self._message_ids)
+            result = self._message(chat_id, video={
+                'file_id': f'video{message_id}', 'file_unique_id': f'u{message_id}',
+                'width': 720, 'height': 1280, 'duration': 6,
+            })
+            if self.on_video:
+                self.on_video(chat_id)
+        elif method in ('sendMessage', 'editMessageText'):
+            result = self._message(chat_id, text=params.get('text', ''))
+        elif method == 'sendMediaGroup':
+            media = params.get('media', '[]')
+            media = json.loads(media) if isinstance(media, str) else media
+            result = []
+            for _ in media:
+                message_id = next(self._message_ids)
+                result.append(self._message(chat_id, video={
+                    'file_id': f'video{message_id}', 'file_unique_id': f'u{message_id}',
+                    'width': 720, 'height': 1280, 'duration': 6,
+                }))
+                if self.on_video:
+                    self.on_video(chat_id)
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+class MockServer:
+    """Serve MockMinimax under /v1 and FakeTelegram under /bot<token> on one port."""
+
+    def __init__(self, minimax: MockMinimax, telegram: FakeTelegram, host: str = '127.0.0.1', port: int = 0):
+        self.minimax = minimax
+        self.telegram = telegram
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=1024 ** 3)
+        self.minimax.add_routes(app)
+        self.telegram.add_routes(app)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        # Pick up the real port when 0 asked for any free one
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.minimax.base_url = self.url
+
+    async def stop(self) -> None:
+        await self.minimax.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    """Command line options shared with benchmark.py."""
+    parser.add_argument('--latency', type=float, default=0.05, help='mean upstream latency (s)')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of requests answered 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='fraction of requests answered 429')
+    parser.add_argument('--generation-time', type=float, default=2.0, help='mean time to generate a video (s)')
+    parser.add_argument('--generation-fail-rate', type=float, default=0.0, help='fraction of generations that fail')
+    parser.add_argument('--video-size', type=int, default=1024 * 1024, help='video size in bytes')
+
+def mock_from_arguments(args: argparse.Namespace) -> MockMinimax:
+    return MockMinimax(
+        latency=args.latency,
+        failure_rate=args.failure_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        generation_time=args.generation_time,
+        generation_fail_rate=args.generation_fail_rate,
+        video_size=args.video_size,
+    )
+
+async def serve(args: argparse.Namespace) -> None:
+    server = MockServer(mock_from_arguments(args), FakeTelegram(), args.host, args.port)
+    await server.start()
+    print(f"Mock Minimax at {server.url}/v1, fake Telegram at {server.url}/bot<token>")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_mock_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
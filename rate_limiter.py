@@ -1,54 +1,267 @@
+import os
 import json
 import time
-import threading
+import heapq
+import asyncio
+import logging
+from collections import deque
 from pathlib import Path
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from metrics import RATE_LIMIT_REJECTIONS
+from state_backend import StateBackend
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated "scope:kind:limit/period" entries. Scopes are user, chat and
+# global; kinds are window (sliding window) and bucket (token bucket).
+DEFAULT_POLICIES = 'user:window:1/3600'
+RATE_LIMIT_POLICIES = os.getenv('RATE_LIMIT_POLICIES', DEFAULT_POLICIES)
+# How often pending rate limit state is written to disk (seconds)
+RATE_LIMIT_FLUSH_INTERVAL = float(os.getenv('RATE_LIMIT_FLUSH_INTERVAL', '30'))
+# Upper bound on expired entries removed per check, keeping checks O(1)
+EXPIRE_BATCH = 8
+
+SCOPES = ('user', 'chat', 'global')
+
+class SlidingWindowPolicy:
+    """Allow at most `limit` requests in any `window` seconds."""
+
+    kind = 'window'
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+
+    def evaluate(self, state: Optional[Deque[float]], now: float, cost: int) -> Tuple[bool, float]:
+        """Return (allowed, seconds until allowed), only pruning expired timestamps."""
+        if cost > self.limit:
+            return False, self.window
+        if state:
+            # Timestamps are appended in order, so expired ones sit at the front
+            while state and state[0] <= now - self.window:
+                state.popleft()
+        used = len(state) if state else 0
+        if used + cost <= self.limit:
+            return True, 0.0
+        return False, state[used + cost - self.limit - 1] + self.window - now
+
+    def consume(self, state: Optional[Deque[float]], now: float, cost: int) -> Deque[float]:
+        """Record an allowed request and return the new state."""
+        state = state if state is not None else deque()
+        state.extend([now] * cost)
+        return state
+
+    def expires_at(self, state: Deque[float]) -> float:
+        """Time after which the state no longer limits anything."""
+        return state[-1] + self.window if state else 0.0
+
+    def dump(self, state: Deque[float]) -> Any:
+        return list(state)
+
+    def load(self, data: Any) -> Deque[float]:
+        return deque(data)
+
+class TokenBucketPolicy:
+    """Allow bursts of `capacity` requests, refilling the bucket over `period` seconds."""
+
+    kind = 'bucket'
+
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    def _tokens(self, state: Optional[List[float]], now: float) -> float:
+        if not state:
+            return float(self.capacity)
+        tokens, updated_at = state
+        return min(self.capacity, tokens + (now - updated_at) * self.rate)
+
+    def evaluate(self, state: Optional[List[float]], now: float, cost: int) -> Tuple[bool, float]:
+        """Return (allowed, seconds until allowed) without changing state."""
+        if cost > self.capacity:
+            return False, self.capacity / self.rate
+        tokens = self._tokens(state, now)
+        if tokens >= cost:
+            return True, 0.0
+        return False, (cost - tokens) / self.rate
+
+    def consume(self, state: Optional[List[float]], now: float, cost: int) -> List[float]:
+        """Record an allowed request and return the new state."""
+        return [self._tokens(state, now) - cost, now]
+
+    def expires_at(self, state: List[float]) -> float:
+        """Time at which the bucket is full again."""
+        tokens, updated_at = state
+        return updated_at + (self.capacity - tokens) / self.rate
+
+    def dump(self, state: List[float]) -> Any:
+        return state
+
+    def load(self, data: Any) -> List[float]:
+        return list(data)
+
+POLICY_KINDS = {
+    SlidingWindowPolicy.kind: SlidingWindowPolicy,
+    TokenBucketPolicy.kind: TokenBucketPolicy,
+}
+
+def parse_policies(spec: str) -> List[Tuple[str, Any]]:
+    """
+    Parse a policy specification such as "user:window:1/3600,global:bucket:30/60".
+
+    Returns:
+        List[Tuple[str, Any]]: (scope, policy) pairs
+
+    Raises:
+        ValueError: If an entry is malformed
+    """
+    policies = []
+    for entry in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            scope, kind, rate = entry.split(':')
+            limit, period = rate.split('/')
+            policy = POLICY_KINDS[kind](int(limit), float(period))
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"Invalid rate limit policy {entry!r}") from e
+        if scope not in SCOPES:
+            raise ValueError(f"Invalid rate limit scope {scope!r}; expected one of {SCOPES}")
+        policies.append((scope, policy))
+    return policies
 
 class RateLimiter:
-    """Rate limiter that restricts users to one request per hour."""
-    
-    def __init__(self, storage_path: str = "rate_limits.json"):
-        """Initialize the rate limiter with storage path."""
+    """
+    Rate limiter applying per-user, per-chat and global policies.
+
+    Each check costs O(1) per configured policy: state lives in memory keyed
+    by policy and subject, expired entries are removed lazily from a heap a
+    few at a time, and changes are written to disk in the background rather
+    than on every request.
+
+    When a shared state backend is given, state lives there instead so that
+    every worker enforces the same limits; each check is then one
+    transaction against the backend.
+    """
+
+    def __init__(
+        self,
+        storage_path: str = "rate_limits.json",
+        policies: Optional[str] = None,
+        backend: Optional[StateBackend] = None,
+    ):
+        """Initialize the rate limiter with storage path and policy specification."""
         self.storage_path = Path(storage_path)
-        self._lock = threading.Lock()
-        self._load_limits()
-    
+        self.policies = parse_policies(policies if policies is not None else RATE_LIMIT_POLICIES)
+        self.backend = backend
+        self.limits: Dict[str, Any] = {}
+        self._expiry: List[Tuple[float, str]] = []  # heap of (expires_at, key)
+        self._dirty = False
+        self._flusher: Optional[asyncio.Task] = None
+        # Saved state is read on first use (or by load()) so construction stays cheap
+        self._loaded = backend is not None
+
+    def load(self) -> None:
+        """Read saved state from the storage file, once."""
+        if not self._loaded:
+            self._loaded = True
+            self._load_limits()
+
+    def _key(self, index: int, subject: Any) -> str:
+        return f"{index}:{subject}"
+
+    def _track(self, key: str, policy: Any) -> None:
+        heapq.heappush(self._expiry, (policy.expires_at(self.limits[key]), key))
+
     def _load_limits(self) -> None:
         """Load rate limits from storage file."""
         try:
-            if self.storage_path.exists():
-                with open(self.storage_path, 'r') as f:
-                    self.limits = json.load(f)
-            else:
-                self.limits = {}
+            if not self.storage_path.exists():
+                return
+            with open(self.storage_path, 'r') as f:
+                data = json.load(f)
         except (json.JSONDecodeError, IOError):
-            self.limits = {}
-    
+            return
+
+        now = time.time()
+        if data.get('version') == 2:
+            specs = data.get('policies', [])
+            for index, (scope, policy) in enumerate(self.policies):
+                # Saved state only applies if the policy is configured the same way
+                if index >= len(specs) or specs[index] != self._describe(scope, policy):
+                    continue
+                prefix = f"{index}:"
+                for key, state in data.get('limits', {}).items():
+                    if key.startswith(prefix):
+                        self.limits[key] = policy.load(state)
+                        self._track(key, policy)
+        else:
+            # Legacy format: {user_id: timestamp of last request}
+            for user_id, last_request in data.items():
+                for index, (scope, policy) in enumerate(self.policies):
+                    if scope == 'user':
+                        key = self._key(index, user_id)
+                        self.limits[key] = policy.consume(None, last_request, 1)
+                        self._track(key, policy)
+        self._expire(now, limit=None)
+
+    def _describe(self, scope: str, policy: Any) -> str:
+        if isinstance(policy, TokenBucketPolicy):
+            return f"{scope}:{policy.kind}:{policy.capacity}/{policy.capacity / policy.rate:g}"
+        return f"{scope}:{policy.kind}:{policy.limit}/{policy.window:g}"
+
+    def _snapshot(self) -> Dict:
+        return {
+            'version': 2,
+            'policies': [self._describe(scope, policy) for scope, policy in self.policies],
+            'limits': {
+                key: self.policies[int(key.split(':', 1)[0])][1].dump(state)
+                for key, state in self.limits.items()
+            },
+        }
+
+    def _write(self, snapshot: Dict) -> None:
+        """Atomically replace the storage file with a snapshot."""
+        tmp_path = self.storage_path.with_name(self.storage_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.storage_path)
+
     def _save_limits(self) -> None:
         """Save rate limits to storage file."""
-        with open(self.storage_path, 'w') as f:
-            json.dump(self.limits, f)
-    
-    def _cleanup_expired(self) -> None:
-        """Remove expired entries."""
-        current_time = time.time()
-        expired = []
-        for user_id, last_request in self.limits.items():
-            if current_time - last_request > 3600:  # 1 hour
-                expired.append(user_id)
-        
-        for user_id in expired:
-            del self.limits[user_id]
-    
-    def check_rate_limit(self, user_id: int, is_admin: bool = False) -> tuple[bool, Optional[int]]:
+        self._write(self._snapshot())
+        self._dirty = False
+
+    def _expire(self, now: float, limit: Optional[int] = EXPIRE_BATCH) -> None:
+        """Remove up to `limit` expired entries (all of them if limit is None)."""
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now and (limit is None or removed < limit):
+            expires_at, key = heapq.heappop(self._expiry)
+            state = self.limits.get(key)
+            if state is None:
+                continue
+            policy = self.policies[int(key.split(':', 1)[0])][1]
+            # Entries refreshed since this heap item was pushed have a later expiry
+            if policy.expires_at(state) <= now:
+                del self.limits[key]
+                self._dirty = True
+                removed += 1
+
+    def check_rate_limit(
+        self,
+        user_id: int,
+        is_admin: bool = False,
+        chat_id: Optional[int] = None,
+        cost: int = 1,
+    ) -> tuple[bool, Optional[int]]:
         """
         Check if a user has exceeded their rate limit.
-        
+
         Args:
             user_id: The user's ID
             is_admin: Whether the user is an admin (bypasses rate limit)
-            
+            chat_id: The chat the request came from, for per-chat policies
+            cost: Number of requests this call counts as
+
         Returns:
             tuple[bool, Optional[int]]: (is_allowed, seconds_remaining)
             - is_allowed: True if request is allowed, False if rate limited
@@ -58,21 +271,74 @@ class RateLimiter:
         if is_admin:
             return True, None
 
-        with self._lock:
-            self._cleanup_expired()
-            
-            current_time = time.time()
-            last_request = self.limits.get(str(user_id))
-            
-            if last_request is None:
-                self.limits[str(user_id)] = current_time
-                self._save_limits()
+        self.load()
+        now = time.time()
+        subjects = {'user': user_id, 'chat': chat_id, 'global': 'all'}
+        if self.backend is not None:
+            # Keyed by the policy description so workers agree regardless of order
+            checks = [
+                (f"{self._describe(scope, policy)}:{subjects[scope]}", policy)
+                for scope, policy in self.policies
+                if subjects[scope] is not None
+            ]
+            allowed, wait = self.backend.consume_rate_limits(checks, now, cost)
+            if allowed:
                 return True, None
-            
-            time_passed = current_time - last_request
-            if time_passed < 3600:  # 1 hour in seconds
-                return False, int(3600 - time_passed)
-            
-            self.limits[str(user_id)] = current_time
+            RATE_LIMIT_REJECTIONS.inc()
+            return False, max(1, int(wait))
+
+        self._expire(now)
+
+        # Every policy must allow the request before any of them is charged
+        applicable = []
+        wait = 0.0
+        for index, (scope, policy) in enumerate(self.policies):
+            if subjects[scope] is None:
+                continue
+            key = self._key(index, subjects[scope])
+            allowed, retry_after = policy.evaluate(self.limits.get(key), now, cost)
+            wait = max(wait, 0.0 if allowed else retry_after)
+            applicable.append((key, policy))
+        if wait > 0:
+            RATE_LIMIT_REJECTIONS.inc()
+            return False, max(1, int(wait))
+
+        for key, policy in applicable:
+            self.limits[key] = policy.consume(self.limits.get(key), now, cost)
+            self._track(key, policy)
+        self._dirty = True
+        return True, None
+
+    def start(self) -> None:
+        """Start flushing state to disk in the background."""
+        if self.backend is not None:
+            return  # every check is already written to the backend
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        """Stop the background flusher and write any pending state."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        self.flush()
+
+    def flush(self) -> None:
+        """Write state to disk if it changed since the last write."""
+        if self._dirty:
             self._save_limits()
-            return True, None
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(RATE_LIMIT_FLUSH_INTERVAL)
+            if not self._dirty:
+                continue
+            # Snapshot on the event loop, write the file off it
+            snapshot = self._snapshot()
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, snapshot)
+            except OSError as e:
+                self._dirty = True
+                logger.error("Failed to save rate limits: %s", e)
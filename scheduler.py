@@ -0,0 +1,245 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Generations a single user may have in flight (submitted and not yet finished)
+MAX_USER_GENERATIONS = int(os.getenv('MAX_USER_GENERATIONS', '5'))
+# Upper and lower bounds for total in-flight generations across all users
+MAX_GLOBAL_GENERATIONS = int(os.getenv('MAX_GLOBAL_GENERATIONS', '20'))
+MIN_GLOBAL_GENERATIONS = int(os.getenv('MIN_GLOBAL_GENERATIONS', '2'))
+# Submits slower than this count as an upstream congestion signal (seconds)
+SUBMIT_LATENCY_TARGET = float(os.getenv('SUBMIT_LATENCY_TARGET', '5'))
+# Minimum time between two multiplicative decreases (seconds)
+BACKOFF_COOLDOWN = 10.0
+# HTTP statuses that mean the upstream is overloaded rather than the request bad
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+# Submits a generation and returns its task_id
+SubmitJob = Callable[[], Awaitable[str]]
+# Told the job's (estimated) queue position when it has to wait
+QueuedCallback = Callable[[int], Awaitable[None]]
+
+class SchedulerClosed(Exception):
+    """A submit refused or dropped from the queue because the scheduler was closed."""
+
+def is_overload_error(error: BaseException) -> bool:
+    """Whether an exception indicates upstream overload rather than a bad request."""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    status = getattr(error, 'status', None)
+    if status is None:
+        # Connection-level failures carry no status
+        return isinstance(error, (ConnectionError, OSError))
+    return status in OVERLOAD_STATUSES
+
+class _Job:
+    __slots__ = ('user_id', 'submit', 'future', 'started')
+
+    def __init__(self, user_id: int, submit: SubmitJob):
+        self.user_id = user_id
+        self.submit = submit
+        self.started = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class GenerationScheduler:
+    """
+    Admit generation submits under per-user and global in-flight limits.
+
+    A generation holds its slot from submit until release() is called when
+    the task finishes. Work beyond the limits waits in per-user queues that
+    are served round-robin, so one user's burst can't starve everyone else.
+    The global limit adapts AIMD-style: it halves on overload errors and
+    slow submits and grows back by roughly one slot per window of successes.
+    """
+
+    def __init__(
+        self,
+        per_user_limit: int = MAX_USER_GENERATIONS,
+        max_concurrency: int = MAX_GLOBAL_GENERATIONS,
+        min_concurrency: int = MIN_GLOBAL_GENERATIONS,
+    ):
+        self.per_user_limit = per_user_limit
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.concurrency_limit = float(max_concurrency)
+        self._queues: 'OrderedDict[int, Deque[_Job]]' = OrderedDict()
+        self._user_in_flight: Dict[int, int] = {}
+        self._owners: Dict[str, int] = {}
+        self._in_flight = 0
+        self._last_backoff = 0.0
+        self._runners: set = set()
+        self.closed = False
+
+    @property
+    def in_flight(self) -> int:
+        """Generations currently holding a slot."""
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        """Submits waiting for a slot."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def queue_position(self, user_id: int) -> int:
+        """Estimated 1-based position of the user's newest queued submit."""
+        queue = self._queues.get(user_id)
+        if not queue:
+            return 0
+        depth = len(queue)
+        # Round-robin serves each user once per turn
+        return sum(min(len(other), depth) for other in self._queues.values())
+
+    async def submit(
+        self, user_id: int, submit: SubmitJob, on_queued: Optional[QueuedCallback] = None
+    ) -> str:
+        """
+        Run a submit once a slot is free.
+
+        Args:
+            user_id: The user the generation is for
+            submit: Coroutine factory that submits the generation
+            on_queued: Called with the queue position if the submit has to wait
+
+        Returns:
+            str: The task_id returned by submit; its slot is held until release()
+        """
+        if self.closed:
+            raise SchedulerClosed("Not accepting new generations")
+        job = _Job(user_id, submit)
+        self._queues.setdefault(user_id, deque()).append(job)
+        self._dispatch()
+        if not job.started and on_queued is not None:
+            try:
+                await on_queued(self.queue_position(user_id))
+            except asyncio.CancelledError:
+                # Nobody is left to record the task, so don't submit it
+                self._discard(job)
+                raise
+            except Exception as e:
+                # The notice is best effort; the submit keeps its place in the queue
+                logger.warning("Queue notification for user %s failed: %s", user_id, e)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._discard(job)
+            raise
+
+    def close(self) -> None:
+        """Refuse new submits and fail queued ones; submits already started still finish."""
+        self.closed = True
+        for queue in self._queues.values():
+            for job in queue:
+                if not job.future.done():
+                    job.future.set_exception(SchedulerClosed("Shutting down before the generation started"))
+        self._queues.clear()
+
+    def adopt(self, user_id: int, task_id: str) -> None:
+        """Count an already-submitted task (e.g. restored at startup) against the limits."""
+        if task_id in self._owners:
+            return
+        self._owners[task_id] = user_id
+        self._acquire(user_id)
+
+    def release(self, task_id: str) -> None:
+        """Free the slot held by a finished task."""
+        user_id = self._owners.pop(task_id, None)
+        if user_id is None:
+            return
+        self._release(user_id)
+        self._dispatch()
+
+    def record_success(self, latency: float) -> None:
+        """Feed a successful submit's latency into the concurrency limit."""
+        if latency > SUBMIT_LATENCY_TARGET:
+            self._back_off()
+        else:
+            self.concurrency_limit = min(
+                self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit
+            )
+
+    def record_failure(self, error: BaseException) -> None:
+        """Feed a failed submit into the concurrency limit."""
+        if is_overload_error(error):
+            self._back_off()
+
+    def _back_off(self) -> None:
+        now = time.monotonic()
+        if now - self._last_backoff < BACKOFF_COOLDOWN:
+            return
+        self._last_backoff = now
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+
+    def _acquire(self, user_id: int) -> None:
+        self._in_flight += 1
+        self._user_in_flight[user_id] = self._user_in_flight.get(user_id, 0) + 1
+
+    def _release(self, user_id: int) -> None:
+        self._in_flight -= 1
+        remaining = self._user_in_flight.get(user_id, 1) - 1
+        if remaining:
+            self._user_in_flight[user_id] = remaining
+        else:
+            self._user_in_flight.pop(user_id, None)
+
+    def _discard(self, job: _Job) -> None:
+        """Drop a job whose caller went away; a started job releases its slot when it finishes."""
+        job.future.cancel()
+        queue = self._queues.get(job.user_id)
+        if queue and job in queue:
+            queue.remove(job)
+            if not queue:
+                del self._queues[job.user_id]
+
+    def _dispatch(self) -> None:
+        """Start queued submits round-robin while there is capacity."""
+        while self._queues and self._in_flight < int(self.concurrency_limit):
+            for user_id in self._queues:
+                if self._user_in_flight.get(user_id, 0) < self.per_user_limit:
+                    break
+            else:
+                return  # everyone queued is at their per-user limit
+
+            queue = self._queues.pop(user_id)
+            job = queue.popleft()
+            if queue:
+                # Back of the line for this user's next submit
+                self._queues[user_id] = queue
+            if job.future.done():
+                continue  # caller gave up while queued
+            self._acquire(user_id)
+            job.started = True
+            runner = asyncio.create_task(self._run(job))
+            self._runners.add(runner)
+            runner.add_done_callback(self._runners.discard)
+
+    async def _run(self, job: _Job) -> None:
+        started = time.monotonic()
+        try:
+            task_id = await job.submit()
+        except asyncio.CancelledError:
+            self._release(job.user_id)
+            job.future.cancel()
+            self._dispatch()
+            raise
+        except Exception as e:
+            self._release(job.user_id)
+            self.record_failure(e)
+            if not job.future.done():
+                job.future.set_exception(e)
+                # Mark retrieved in case the caller is already gone
+                job.future.exception()
+            self._dispatch()
+            return
+
+        self.record_success(time.monotonic() - started)
+        self._owners[task_id] = job.user_id
+        if job.future.done():
+            # Nobody is waiting for this task, so nothing will release it later
+            self.release(task_id)
+        else:
+            job.future.set_result(task_id)
@@ -0,0 +1,135 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+class StateBackend(ABC):
+    """
+    Storage for state that several bot workers need to share.
+
+    Covers generation tasks and their deliveries, the video cache, rate limit
+    counters, and leases that decide which worker polls which task. All
+    methods are synchronous and expected to be fast; implementations must be
+    safe to use from several processes at once. TaskStore (SQLite) is the
+    bundled implementation.
+    """
+
+    # Tasks and deliveries
+
+    @abstractmethod
+    def save_task(self, task_id: str, task: Dict) -> None:
+        """Insert or replace a task record."""
+
+    @abstractmethod
+    def update_status(self, task_id: str, status: str, file_id: Optional[str] = None) -> None:
+        """Record a status change, keeping any file_id already stored."""
+
+    @abstractmethod
+    def load_task(self, task_id: str) -> Optional[Dict]:
+        """Load a single task with its undelivered recipients."""
+
+    @abstractmethod
+    def load_unfinished(self) -> Dict[str, Dict]:
+        """Load tasks still generating or with results not yet delivered."""
+
+    @abstractmethod
+    def record_give_up(self, task_id: str) -> int:
+        """Count a round of polling that gave up on a task. Returns the rounds so far."""
+
+    @abstractmethod
+    def add_delivery(self, task_id: str, chat_id: int, message_id: int) -> None:
+        """Record a chat message that should receive the task's result."""
+
+    @abstractmethod
+    def set_status_message(self, task_id: str, chat_id: int, message_id: int, status_message_id: int) -> None:
+        """Record the bot's progress message for a delivery, edited as the task's status changes."""
+
+    @abstractmethod
+    def load_status_messages(self, task_id: str) -> List[Tuple[int, int]]:
+        """(chat_id, status_message_id) pairs of a task's progress messages."""
+
+    @abstractmethod
+    def load_deliveries(self, task_id: str) -> List[Tuple[int, int]]:
+        """(chat_id, message_id) pairs still waiting for a task's result."""
+
+    @abstractmethod
+    def claim_delivery(self, task_id: str, chat_id: int, message_id: int, owner: str) -> bool:
+        """Reserve a delivery for one worker. Returns False if another worker holds it."""
+
+    @abstractmethod
+    def release_delivery(self, task_id: str, chat_id: int, message_id: int, owner: str) -> None:
+        """Give up a claimed delivery so it can be retried."""
+
+    @abstractmethod
+    def mark_delivered(self, task_id: str, chat_id: int, message_id: int) -> None:
+        """Record that the result reached a waiting chat."""
+
+    @abstractmethod
+    def evict_expired(self, max_age: int) -> int:
+        """Delete old tasks and expired entries. Returns the number of tasks removed."""
+
+    # Task groups (batches delivered together)
+
+    @abstractmethod
+    def save_group(self, group_id: str, group: Dict) -> None:
+        """Insert or replace a task group record; its tasks carry the group_id."""
+
+    @abstractmethod
+    def load_group(self, group_id: str) -> Optional[Dict]:
+        """Load a task group with the current status of each of its tasks."""
+
+    @abstractmethod
+    def finish_group(self, group_id: str) -> bool:
+        """Mark a group delivered. Returns True only for the first caller."""
+
+    # Task polling leases
+
+    @abstractmethod
+    def acquire_lease(self, task_id: str, owner: str, ttl: float) -> bool:
+        """Take or renew ownership of polling a task. Returns False if another owner holds it."""
+
+    @abstractmethod
+    def release_lease(self, task_id: str, owner: str) -> None:
+        """Give up ownership of a task."""
+
+    @abstractmethod
+    def release_leases(self, owner: str) -> None:
+        """Give up every lease held by an owner, e.g. on shutdown."""
+
+    # Video cache
+
+    @abstractmethod
+    def load_video_cache(self, limit: int) -> Dict[str, Dict]:
+        """Load the most recently used video cache entries that have not expired."""
+
+    @abstractmethod
+    def load_video_cache_entry(self, task_id: str) -> Optional[Dict]:
+        """Load one video cache entry."""
+
+    @abstractmethod
+    def save_video_cache(self, task_id: str, entry: Dict) -> None:
+        """Insert or replace a video cache entry."""
+
+    @abstractmethod
+    def delete_video_cache(self, task_id: str) -> None:
+        """Remove a video cache entry."""
+
+    @abstractmethod
+    def evict_video_cache(self, max_entries: int) -> int:
+        """Delete expired cache entries and trim to the max_entries most recent."""
+
+    # Rate limits
+
+    @abstractmethod
+    def consume_rate_limits(
+        self, checks: List[Tuple[str, Any]], now: float, cost: int
+    ) -> Tuple[bool, float]:
+        """
+        Atomically check and charge a request against several rate limit policies.
+
+        Args:
+            checks: (key, policy) pairs; policies are rate_limiter policy objects
+            now: Current time
+            cost: Number of requests to charge
+
+        Returns:
+            Tuple[bool, float]: (allowed, seconds until allowed)
+        """
@@ -0,0 +1,497 @@
+import os
+import json
+import time
+import sqlite3
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from state_backend import StateBackend
+
+TASK_DB_PATH = os.getenv('TASK_DB_PATH', 'tasks.db')
+# Finished tasks are kept this long so /status still works, then evicted (seconds)
+TASK_RETENTION_SECONDS = int(os.getenv('TASK_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+# How long a write waits for another worker's transaction to finish (milliseconds)
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))
+# A worker has this long to finish a claimed delivery before others may retry it (seconds)
+DELIVERY_CLAIM_TTL = 600.0
+# Deliveries that failed this many times are no longer retried
+MAX_DELIVERY_ATTEMPTS = int(os.getenv('MAX_DELIVERY_ATTEMPTS', '3'))
+# Unfinished tasks whose polling gave up this many times are no longer picked
+# up again; the chats waiting on them are told once instead
+MAX_MONITOR_ROUNDS = int(os.getenv('MAX_MONITOR_ROUNDS', '3'))
+
+FINAL_STATUSES = ('Success', 'Fail')
+
+# Each entry upgrades the schema by one version (PRAGMA user_version)
+MIGRATIONS = [
+    """
+    CREATE TABLE tasks (
+        task_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        object TEXT NOT NULL,
+        prompt TEXT NOT NULL,
+        status TEXT NOT NULL,
+        file_id TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE deliveries (
+        task_id TEXT NOT NULL REFERENCES tasks(task_id) ON DELETE CASCADE,
+        chat_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        delivered_at REAL,
+        PRIMARY KEY (task_id, chat_id, message_id)
+    );
+    CREATE INDEX tasks_updated_at ON tasks(updated_at);
+    """,
+    """
+    CREATE TABLE video_cache (
+        task_id TEXT PRIMARY KEY,
+        telegram_file_id TEXT,
+        telegram_file_id_expires REAL,
+        download_url TEXT,
+        download_url_expires REAL,
+        updated_at REAL NOT NULL
+    );
+    CREATE INDEX video_cache_updated_at ON video_cache(updated_at);
+    """,
+    """
+    CREATE TABLE rate_limits (
+        key TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE INDEX rate_limits_expires_at ON rate_limits(expires_at);
+    CREATE TABLE task_leases (
+        task_id TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    ALTER TABLE deliveries ADD COLUMN claimed_by TEXT;
+    ALTER TABLE deliveries ADD COLUMN claimed_at REAL;
+    ALTER TABLE deliveries ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+    """,
+    """
+    CREATE TABLE task_groups (
+        group_id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        status_message_id INTEGER,
+        created_at REAL NOT NULL,
+        delivered_at REAL
+    );
+    ALTER TABLE tasks ADD COLUMN group_id TEXT;
+    CREATE INDEX tasks_group_id ON tasks(group_id);
+    """,
+    """
+    ALTER TABLE deliveries ADD COLUMN status_message_id INTEGER;
+    """,
+    """
+    ALTER TABLE tasks ADD COLUMN monitor_give_ups INTEGER NOT NULL DEFAULT 0;
+    """,
+]
+
+class TaskStore(StateBackend):
+    """Durable record of generation tasks and the chats waiting on them.
+
+    Backed by SQLite in WAL mode so every state change survives a crash and
+    unfinished work can be picked up again on startup. Several bot processes
+    on one host can share the same database file: read-modify-write steps run
+    in IMMEDIATE transactions and single-statement upserts, and writers wait
+    up to SQLITE_BUSY_TIMEOUT for each other.
+    """
+
+    def __init__(self, path: str = TASK_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # NORMAL is durable against application crashes in WAL mode
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+        self._conn.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+        self._migrate()
+
+    def _migrate(self) -> None:
+        """Bring the schema up to the latest version."""
+        with self._transaction():
+            # Re-read inside the lock in case another worker migrated first
+            version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+            for target, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in filter(None, (part.strip() for part in script.split(';'))):
+                    self._conn.execute(statement)
+                self._conn.execute(f'PRAGMA user_version = {target}')
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Run statements atomically, holding the write lock from the start."""
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+    def save_task(self, task_id: str, task: Dict) -> None:
+        """Insert or replace a task record."""
+        now = time.time()
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO tasks
+                (task_id, user_id, action, object, prompt, status, file_id, created_at, updated_at, group_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                task_id, task['user_id'], task['action'], task['object'], task['prompt'],
+                task['status'], task.get('file_id'), task.get('created_at', now), now,
+                task.get('group_id'),
+            ),
+        )
+
+    def update_status(self, task_id: str, status: str, file_id: Optional[str] = None) -> None:
+        """Record a status change, keeping any file_id already stored."""
+        self._conn.execute(
+            "UPDATE tasks SET status = ?, file_id = COALESCE(?, file_id), updated_at = ? WHERE task_id = ?",
+            (status, file_id, time.time(), task_id),
+        )
+
+    def record_give_up(self, task_id: str) -> int:
+        """Count a round of polling that gave up on a task. Returns the rounds so far."""
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE tasks SET monitor_give_ups = monitor_give_ups + 1 WHERE task_id = ?",
+                (task_id,),
+            )
+            row = self._conn.execute(
+                "SELECT monitor_give_ups FROM tasks WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        return row['monitor_give_ups'] if row else MAX_MONITOR_ROUNDS
+
+    def add_delivery(self, task_id: str, chat_id: int, message_id: int) -> None:
+        """Record a chat message that should receive the task's result."""
+        self._conn.execute(
+            "INSERT OR IGNORE INTO deliveries (task_id, chat_id, message_id) VALUES (?, ?, ?)",
+            (task_id, chat_id, message_id),
+        )
+
+    def mark_delivered(self, task_id: str, chat_id: int, message_id: int) -> None:
+        """Record that the result reached a waiting chat."""
+        self._conn.execute(
+            "UPDATE deliveries SET delivered_at = ? WHERE task_id = ? AND chat_id = ? AND message_id = ?",
+            (time.time(), task_id, chat_id, message_id),
+        )
+
+    def set_status_message(self, task_id: str, chat_id: int, message_id: int, status_message_id: int) -> None:
+        """Record the bot's progress message for a delivery, edited as the task's status changes."""
+        self._conn.execute(
+            """
+            UPDATE deliveries SET status_message_id = ?
+            WHERE task_id = ? AND chat_id = ? AND message_id = ?
+            """,
+            (status_message_id, task_id, chat_id, message_id),
+        )
+
+    def load_status_messages(self, task_id: str) -> List[Tuple[int, int]]:
+        """(chat_id, status_message_id) pairs of a task's progress messages."""
+        rows = self._conn.execute(
+            """
+            SELECT chat_id, status_message_id FROM deliveries
+            WHERE task_id = ? AND status_message_id IS NOT NULL
+            """,
+            (task_id,),
+        )
+        return [(row['chat_id'], row['status_message_id']) for row in rows]
+
+    def load_deliveries(self, task_id: str) -> List[Tuple[int, int]]:
+        """(chat_id, message_id) pairs still waiting for a task's result."""
+        rows = self._conn.execute(
+            """
+            SELECT chat_id, message_id FROM deliveries
+            WHERE task_id = ? AND delivered_at IS NULL AND attempts < ?
+            """,
+            (task_id, MAX_DELIVERY_ATTEMPTS),
+        )
+        return [(row['chat_id'], row['message_id']) for row in rows]
+
+    def claim_delivery(self, task_id: str, chat_id: int, message_id: int, owner: str) -> bool:
+        """
+        Reserve a delivery for one worker. Returns False if another worker holds it.
+
+        Each claim counts as a delivery attempt, so only claim once the task's
+        final status is known and a result is about to be sent. An owner may
+        re-claim its own deliveries, e.g. ones left claimed by a crash before
+        a restart.
+        """
+        now = time.time()
+        cursor = self._conn.execute(
+            """
+            UPDATE deliveries SET claimed_by = ?, claimed_at = ?, attempts = attempts + 1
+            WHERE task_id = ? AND chat_id = ? AND message_id = ? AND delivered_at IS NULL
+              AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at <= ?)
+            """,
+            (owner, now, task_id, chat_id, message_id, owner, now - DELIVERY_CLAIM_TTL),
+        )
+        return cursor.rowcount == 1
+
+    def release_delivery(self, task_id: str, chat_id: int, message_id: int, owner: str) -> None:
+        """Give up a claimed delivery so it can be retried."""
+        self._conn.execute(
+            """
+            UPDATE deliveries SET claimed_by = NULL, claimed_at = NULL
+            WHERE task_id = ? AND chat_id = ? AND message_id = ? AND claimed_by = ?
+            """,
+            (task_id, chat_id, message_id, owner),
+        )
+
+    def _row_to_task(self, row: sqlite3.Row) -> Dict:
+        task = {
+            'user_id': row['user_id'],
+            'action': row['action'],
+            'object': row['object'],
+            'status': row['status'],
+            'prompt': row['prompt'],
+            'created_at': row['created_at'],
+            'deliveries': [],
+        }
+        if row['file_id']:
+            task['file_id'] = row['file_id']
+        if row['group_id']:
+            task['group_id'] = row['group_id']
+        if row['monitor_give_ups'] >= MAX_MONITOR_ROUNDS:
+            task['gave_up'] = True
+        return task
+
+    def _attach_deliveries(self, tasks: Dict[str, Dict], pending_only: bool) -> None:
+        if not tasks:
+            return
+        query = "SELECT task_id, chat_id, message_id FROM deliveries WHERE task_id IN ({})".format(
+            ','.join('?' * len(tasks))
+        )
+        params: List[Any] = list(tasks)
+        if pending_only:
+            query += " AND delivered_at IS NULL AND attempts < ?"
+            params.append(MAX_DELIVERY_ATTEMPTS)
+        for row in self._conn.execute(query, params):
+            tasks[row['task_id']]['deliveries'].append((row['chat_id'], row['message_id']))
+
+    def load_task(self, task_id: str) -> Optional[Dict]:
+        """Load a single task with its undelivered recipients."""
+        row = self._conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        tasks = {task_id: self._row_to_task(row)}
+        self._attach_deliveries(tasks, pending_only=True)
+        return tasks[task_id]
+
+    def load_unfinished(self) -> Dict[str, Dict]:
+        """
+        Load tasks still generating or with results not yet delivered.
+
+        Unfinished tasks that polling gave up on MAX_MONITOR_ROUNDS times are
+        left out, unless a chat still has to be told about it.
+        """
+        final = ','.join('?' * len(FINAL_STATUSES))
+        rows = self._conn.execute(
+            f"""
+            SELECT * FROM tasks
+            WHERE (status NOT IN ({final}) AND monitor_give_ups < ?)
+               OR task_id IN (
+                   SELECT task_id FROM deliveries WHERE delivered_at IS NULL AND attempts < ?
+               )
+               OR (
+                   group_id IN (SELECT group_id FROM task_groups WHERE delivered_at IS NULL)
+                   AND (status IN ({final}) OR monitor_give_ups < ?)
+               )
+            """,
+            (
+                *FINAL_STATUSES, MAX_MONITOR_ROUNDS, MAX_DELIVERY_ATTEMPTS,
+                *FINAL_STATUSES, MAX_MONITOR_ROUNDS,
+            ),
+        ).fetchall()
+        tasks = {row['task_id']: self._row_to_task(row) for row in rows}
+        self._attach_deliveries(tasks, pending_only=True)
+        return tasks
+
+    def evict_expired(self, max_age: int = TASK_RETENTION_SECONDS) -> int:
+        """Delete tasks untouched for longer than max_age, plus expired leases and
+        rate limit state. Returns the number of tasks removed."""
+        now = time.time()
+        cursor = self._conn.execute("DELETE FROM tasks WHERE updated_at < ?", (now - max_age,))
+        self._conn.execute("DELETE FROM task_groups WHERE created_at < ?", (now - max_age,))
+        self._conn.execute("DELETE FROM task_leases WHERE expires_at <= ?", (now,))
+        self._conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+        return cursor.rowcount
+
+    def save_group(self, group_id: str, group: Dict) -> None:
+        """Insert or replace a task group record; its tasks carry the group_id."""
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO task_groups
+                (group_id, user_id, chat_id, message_id, status_message_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                group_id, group['user_id'], group['chat_id'], group['message_id'],
+                group.get('status_message_id'), group.get('created_at', time.time()),
+            ),
+        )
+
+    def load_group(self, group_id: str) -> Optional[Dict]:
+        """Load a task group with the current status of each of its tasks."""
+        row = self._conn.execute(
+            "SELECT * FROM task_groups WHERE group_id = ?", (group_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        rows = self._conn.execute(
+            """
+            SELECT task_id, status, monitor_give_ups FROM tasks
+            WHERE group_id = ? ORDER BY created_at, task_id
+            """,
+            (group_id,),
+        ).fetchall()
+        return {
+            'user_id': row['user_id'],
+            'chat_id': row['chat_id'],
+            'message_id': row['message_id'],
+            'status_message_id': row['status_message_id'],
+            'created_at': row['created_at'],
+            'delivered': row['delivered_at'] is not None,
+            'statuses': {task_row['task_id']: task_row['status'] for task_row in rows},
+            # Tasks that polling gave up on for good, so they never reach a final status
+            'abandoned': [
+                task_row['task_id'] for task_row in rows
+                if task_row['status'] not in FINAL_STATUSES
+                and task_row['monitor_give_ups'] >= MAX_MONITOR_ROUNDS
+            ],
+        }
+
+    def finish_group(self, group_id: str) -> bool:
+        """Mark a group delivered. Returns True only for the first caller."""
+        cursor = self._conn.execute(
+            "UPDATE task_groups SET delivered_at = ? WHERE group_id = ? AND delivered_at IS NULL",
+            (time.time(), group_id),
+        )
+        return cursor.rowcount == 1
+
+    def acquire_lease(self, task_id: str, owner: str, ttl: float) -> bool:
+        """Take or renew ownership of polling a task. Returns False if another owner holds it."""
+        now = time.time()
+        cursor = self._conn.execute(
+            """
+            INSERT INTO task_leases (task_id, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(task_id) DO UPDATE
+                SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE task_leases.owner = excluded.owner OR task_leases.expires_at <= ?
+            """,
+            (task_id, owner, now + ttl, now),
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, task_id: str, owner: str) -> None:
+        """Give up ownership of a task."""
+        self._conn.execute(
+            "DELETE FROM task_leases WHERE task_id = ? AND owner = ?", (task_id, owner)
+        )
+
+    def release_leases(self, owner: str) -> None:
+        """Give up every lease held by an owner, e.g. on shutdown."""
+        self._conn.execute("DELETE FROM task_leases WHERE owner = ?", (owner,))
+
+    def load_video_cache(self, limit: int) -> Dict[str, Dict]:
+        """Load the most recently used video cache entries that have not expired."""
+        rows = self._conn.execute(
+            """
+            SELECT * FROM video_cache
+            WHERE MAX(COALESCE(telegram_file_id_expires, 0), COALESCE(download_url_expires, 0)) > ?
+            ORDER BY updated_at DESC
+            LIMIT ?
+            """,
+            (time.time(), limit),
+        ).fetchall()
+        # Oldest first, so callers can rebuild LRU order by insertion
+        return {row['task_id']: self._row_to_cache_entry(row) for row in reversed(rows)}
+
+    def load_video_cache_entry(self, task_id: str) -> Optional[Dict]:
+        """Load one video cache entry, e.g. one written by another worker."""
+        row = self._conn.execute(
+            "SELECT * FROM video_cache WHERE task_id = ?", (task_id,)
+        ).fetchone()
+        return self._row_to_cache_entry(row) if row else None
+
+    def _row_to_cache_entry(self, row: sqlite3.Row) -> Dict:
+        return {
+            'telegram_file_id': (row['telegram_file_id'], row['telegram_file_id_expires']),
+            'download_url': (row['download_url'], row['download_url_expires']),
+        }
+
+    def save_video_cache(self, task_id: str, entry: Dict) -> None:
+        """Insert or replace a video cache entry."""
+        file_id, file_id_expires = entry.get('telegram_file_id', (None, None))
+        url, url_expires = entry.get('download_url', (None, None))
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO video_cache
+                (task_id, telegram_file_id, telegram_file_id_expires, download_url, download_url_expires, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (task_id, file_id, file_id_expires, url, url_expires, time.time()),
+        )
+
+    def delete_video_cache(self, task_id: str) -> None:
+        """Remove a video cache entry."""
+        self._conn.execute("DELETE FROM video_cache WHERE task_id = ?", (task_id,))
+
+    def evict_video_cache(self, max_entries: int) -> int:
+        """Delete expired cache entries and trim to the max_entries most recent."""
+        cursor = self._conn.execute(
+            """
+            DELETE FROM video_cache
+            WHERE MAX(COALESCE(telegram_file_id_expires, 0), COALESCE(download_url_expires, 0)) <= ?
+               OR task_id NOT IN (SELECT task_id FROM video_cache ORDER BY updated_at DESC LIMIT ?)
+            """,
+            (time.time(), max_entries),
+        )
+        return cursor.rowcount
+
+    def consume_rate_limits(
+        self, checks: List[Tuple[str, Any]], now: float, cost: int
+    ) -> Tuple[bool, float]:
+        """Atomically check and charge a request against several rate limit policies."""
+        keys = [key for key, _ in checks]
+        if not keys:
+            return True, 0.0
+        with self._transaction():
+            rows = self._conn.execute(
+                "SELECT key, state FROM rate_limits WHERE key IN ({}) AND expires_at > ?".format(
+                    ','.join('?' * len(keys))
+                ),
+                (*keys, now),
+            )
+            stored = {row['key']: json.loads(row['state']) for row in rows}
+
+            # Every policy must allow the request before any of them is charged
+            states = {}
+            wait = 0.0
+            for key, policy in checks:
+                states[key] = policy.load(stored[key]) if key in stored else None
+                allowed, retry_after = policy.evaluate(states[key], now, cost)
+                wait = max(wait, 0.0 if allowed else retry_after)
+            if wait > 0:
+                return False, wait
+
+            for key, policy in checks:
+                state = policy.consume(states[key], now, cost)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, state, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(policy.dump(state)), policy.expires_at(state)),
+                )
+        return True, 0.0
@@ -0,0 +1,159 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Updates handled at the same time across all users
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+# Updates accepted (running or waiting) before new ones are shed
+UPDATE_QUEUE_LIMIT = int(os.getenv('UPDATE_QUEUE_LIMIT', '1000'))
+# Updates a single user may have waiting before their extras are shed
+USER_QUEUE_LIMIT = int(os.getenv('USER_QUEUE_LIMIT', '5'))
+
+# A user whose updates are shed is told so at most once per interval (seconds)
+BUSY_REPLY_INTERVAL = float(os.getenv('BUSY_REPLY_INTERVAL', '60'))
+# Users remembered for BUSY_REPLY_INTERVAL
+BUSY_REPLY_MEMORY = 10000
+
+BUSY_MESSAGE = "🐢 The bot is very busy right now. Please try again in a minute."
+
+class FairUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently while keeping each user's updates in order.
+
+    Updates from the same user run one at a time in arrival order; updates
+    from different users run in parallel up to `concurrency`. When more than
+    `queue_limit` updates are waiting, or one user has more than
+    `user_queue_limit` waiting, new updates are shed instead of piling up
+    until Telegram's requests time out. Each user is told so at most once
+    per BUSY_REPLY_INTERVAL, so shedding adds little outbound traffic.
+
+    A handler that has to wait a long time (e.g. for a generation slot)
+    calls detach() once its ordered part is done. This frees its place in
+    the user's order and its concurrency slot. It still counts towards
+    `queue_limit` until it finishes.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = UPDATE_CONCURRENCY,
+        queue_limit: int = UPDATE_QUEUE_LIMIT,
+        user_queue_limit: int = USER_QUEUE_LIMIT,
+    ):
+        # The base semaphore only bounds accepted updates; real concurrency is
+        # limited below, after the per-user lock, so waiting users hold no slot.
+        super().__init__(max_concurrent_updates=max(queue_limit, concurrency) + 1)
+        self.queue_limit = queue_limit
+        self.user_queue_limit = user_queue_limit
+        self._running = asyncio.Semaphore(concurrency)
+        self._user_locks: Dict[Any, asyncio.Lock] = {}
+        self._user_pending: Dict[Any, int] = {}
+        self._pending = 0
+        # id(update) -> releases still owed for its per-user order and concurrency slot
+        self._held: Dict[int, List[Callable[[], None]]] = {}
+        self._busy_replied: 'OrderedDict[Any, float]' = OrderedDict()
+
+    @property
+    def pending(self) -> int:
+        """Updates accepted and not yet finished."""
+        return self._pending
+
+    def _user_key(self, update: object) -> Optional[Any]:
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return ('chat', update.effective_chat.id)
+        return None
+
+    def _should_reply_busy(self, key: Optional[Any]) -> bool:
+        if key is None:
+            return False
+        now = time.monotonic()
+        replied_at = self._busy_replied.get(key)
+        if replied_at is not None and now - replied_at < BUSY_REPLY_INTERVAL:
+            return False
+        self._busy_replied[key] = now
+        self._busy_replied.move_to_end(key)
+        while len(self._busy_replied) > BUSY_REPLY_MEMORY:
+            self._busy_replied.popitem(last=False)
+        return True
+
+    async def _shed(self, update: object, key: Optional[Any], coroutine: Awaitable[Any]) -> None:
+        """Drop an update, telling the user unless they were told recently."""
+        coroutine.close()
+        logger.warning("Shedding update: %d pending", self._pending)
+        if (
+            isinstance(update, Update) and update.effective_message and update.effective_message.text
+            and self._should_reply_busy(key)
+        ):
+            try:
+                await update.effective_message.reply_text(BUSY_MESSAGE)
+            except TelegramError as e:
+                logger.debug("Busy reply failed: %s", e)
+
+    def _release_user(self, key: Any) -> None:
+        remaining = self._user_pending[key] - 1
+        if remaining:
+            self._user_pending[key] = remaining
+        else:
+            # Nobody else is waiting on this user's lock
+            del self._user_pending[key]
+            self._user_locks.pop(key, None)
+
+    @staticmethod
+    def _release(held: List[Callable[[], None]]) -> None:
+        while held:
+            held.pop()()
+
+    def detach(self, update: object) -> None:
+        """
+        Let the rest of an update's handling run outside the user's order and
+        the concurrency limit. Does nothing if the update isn't being
+        processed here.
+        """
+        held = self._held.pop(id(update), None)
+        if held:
+            self._release(held)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Run the update's handlers after the user's earlier updates, within the concurrency limit."""
+        key = self._user_key(update)
+        if self._pending >= self.queue_limit or (
+            key is not None and self._user_pending.get(key, 0) >= self.user_queue_limit
+        ):
+            await self._shed(update, key, coroutine)
+            return
+
+        self._pending += 1
+        # Released in reverse order: concurrency slot, user lock, user's pending count
+        held: List[Callable[[], None]] = []
+        try:
+            if key is not None:
+                self._user_pending[key] = self._user_pending.get(key, 0) + 1
+                held.append(lambda: self._release_user(key))
+                lock = self._user_locks.setdefault(key, asyncio.Lock())
+                await lock.acquire()
+                held.append(lock.release)
+            await self._running.acquire()
+            held.append(self._running.release)
+            self._held[id(update)] = held
+            await coroutine
+        finally:
+            self._held.pop(id(update), None)
+            self._release(held)
+            self._pending -= 1
+
+    async def initialize(self) -> None:
+        """Nothing to set up."""
+
+    async def shutdown(self) -> None:
+        """Nothing to tear down."""
@@ -0,0 +1,81 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from state_backend import StateBackend
+
+VIDEO_CACHE_SIZE = int(os.getenv('VIDEO_CACHE_SIZE', '1000'))
+# Telegram file_ids stay valid for a long time; Minimax download URLs expire
+# 9 hours after they are issued, so they are dropped with an hour to spare.
+TELEGRAM_FILE_ID_TTL = int(os.getenv('TELEGRAM_FILE_ID_TTL', str(30 * 24 * 3600)))
+DOWNLOAD_URL_TTL = int(os.getenv('DOWNLOAD_URL_TTL', str(8 * 3600)))
+
+TELEGRAM_FILE_ID = 'telegram_file_id'
+DOWNLOAD_URL = 'download_url'
+
+class VideoCache:
+    """LRU cache of where a finished task's video can be resent from.
+
+    Each task_id maps to the Telegram file_id of the uploaded video and the
+    Minimax download URL, each with its own expiry. Entries are written
+    through to the state backend so they survive restarts, and misses are
+    read through so uploads made by other workers are reused.
+    """
+
+    def __init__(self, store: Optional[StateBackend] = None, max_entries: int = VIDEO_CACHE_SIZE):
+        self.store = store
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, Dict[str, Tuple[Optional[str], Optional[float]]]]' = OrderedDict()
+
+    def load(self) -> None:
+        """Load persisted entries from the task store."""
+        if not self.store:
+            return
+        self.store.evict_video_cache(self.max_entries)
+        self._entries.update(self.store.load_video_cache(self.max_entries))
+
+    def _get(self, task_id: str, field: str) -> Optional[str]:
+        entry = self._entries.get(task_id)
+        if entry is None and self.store:
+            entry = self.store.load_video_cache_entry(task_id)
+            if entry is not None:
+                self._entries[task_id] = entry
+                self._trim()
+        if entry is None:
+            return None
+        value, expires_at = entry.get(field, (None, None))
+        if value is None or expires_at is None or expires_at <= time.time():
+            return None
+        self._entries.move_to_end(task_id)
+        return value
+
+    def _set(self, task_id: str, field: str, value: Optional[str], ttl: int) -> None:
+        entry = self._entries.setdefault(task_id, {})
+        entry[field] = (value, time.time() + ttl) if value else (None, None)
+        self._entries.move_to_end(task_id)
+        self._trim()
+        if self.store:
+            self.store.save_video_cache(task_id, entry)
+
+    def _trim(self) -> None:
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            if self.store:
+                self.store.delete_video_cache(evicted)
+
+    def get_file_id(self, task_id: str) -> Optional[str]:
+        """Get the cached Telegram file_id for a task's video."""
+        return self._get(task_id, TELEGRAM_FILE_ID)
+
+    def set_file_id(self, task_id: str, file_id: Optional[str]) -> None:
+        """Cache the Telegram file_id of an uploaded video; None invalidates it."""
+        self._set(task_id, TELEGRAM_FILE_ID, file_id, TELEGRAM_FILE_ID_TTL)
+
+    def get_download_url(self, task_id: str) -> Optional[str]:
+        """Get the cached Minimax download URL for a task's video."""
+        return self._get(task_id, DOWNLOAD_URL)
+
+    def set_download_url(self, task_id: str, url: Optional[str]) -> None:
+        """Cache a Minimax download URL; None invalidates it."""
+        self._set(task_id, DOWNLOAD_URL, url, DOWNLOAD_URL_TTL)
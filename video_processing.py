@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from metrics import VIDEO_PROCESSING_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Post-process downloaded videos with ffmpeg before they are sent
+VIDEO_PROCESSING = os.getenv('VIDEO_PROCESSING', '').lower() in ('1', 'true', 'yes')
+FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+FFPROBE_PATH = os.getenv('FFPROBE_PATH', 'ffprobe')
+VIDEO_PROCESSING_WORKERS = int(os.getenv('VIDEO_PROCESSING_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Videos larger than this are re-encoded to fit; smaller ones are only remuxed.
+# The Bot API refuses uploads over 50 MB.
+VIDEO_TARGET_SIZE_MB = float(os.getenv('VIDEO_TARGET_SIZE_MB', '45'))
+VIDEO_PREVIEW_SECONDS = float(os.getenv('VIDEO_PREVIEW_SECONDS', '3'))
+PROCESSED_VIDEO_DIR = os.getenv('PROCESSED_VIDEO_DIR', os.path.join(tempfile.gettempdir(), 'catbot-videos'))
+# Processed outputs are kept this long (seconds) for repeat deliveries
+PROCESSED_VIDEO_TTL = int(os.getenv('PROCESSED_VIDEO_TTL', str(24 * 3600)))
+
+TELEGRAM_UPLOAD_LIMIT = 50 * 1024 ** 2
+AUDIO_BITRATE = 128_000
+MIN_VIDEO_BITRATE = 200_000
+THUMBNAIL_WIDTH = 320  # Telegram shows thumbnails up to 320px
+MANIFEST = 'manifest.json'
+EVICTION_INTERVAL = 3600
+
+def _run(command: List[str]) -> str:
+    result = subprocess.run(command, capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(command[0])} failed: {result.stderr.strip()[-500:]}")
+    return result.stdout
+
+def probe_video(path: str) -> Dict:
+    """Duration, dimensions and whether the file has an audio track."""
+    output = _run([
+        FFPROBE_PATH, '-v', 'error', '-show_entries',
+        'format=duration:stream=codec_type,width,height', '-of', 'json', path,
+    ])
+    info = json.loads(output)
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    return {
+        'duration': float(info.get('format', {}).get('duration') or 0),
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'has_audio': any(s.get('codec_type') == 'audio' for s in streams),
+    }
+
+def process_video(source: str, output_dir: str, target_size: int, preview_seconds: float) -> Dict:
+    """
+    Produce a streaming-friendly video, a JPEG thumbnail and a short silent
+    animated preview of `source` in `output_dir`. Runs in a worker process.
+
+    The manifest describing the outputs is written last, so a directory
+    with a manifest always holds complete outputs.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    info = probe_video(source)
+    duration = info['duration']
+    video_path = os.path.join(output_dir, 'video.mp4')
+    partial = video_path + '.part'
+
+    # faststart moves the index to the front so playback starts before the download ends
+    command = [FFMPEG_PATH, '-y', '-v', 'error', '-i', source]
+    if os.path.getsize(source) <= target_size or not duration:
+        command += ['-c', 'copy']
+    else:
+        audio_bitrate = AUDIO_BITRATE if info['has_audio'] else 0
+        # Leave 5% for container overhead
+        video_bitrate = max(MIN_VIDEO_BITRATE, int(target_size * 8 * 0.95 / duration) - audio_bitrate)
+        command += [
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+            '-b:v', str(video_bitrate), '-maxrate', str(video_bitrate), '-bufsize', str(2 * video_bitrate),
+            '-c:a', 'aac', '-b:a', str(AUDIO_BITRATE),
+        ]
+    _run(command + ['-movflags', '+faststart', '-f', 'mp4', partial])
+    os.replace(partial, video_path)
+
+    thumbnail_path = os.path.join(output_dir, 'thumbnail.jpg')
+    _run([
+        FFMPEG_PATH, '-y', '-v', 'error', '-ss', str(min(1.0, duration / 2)), '-i', video_path,
+        '-frames:v', '1', '-vf', f'scale={THUMBNAIL_WIDTH}:-2', '-q:v', '4', thumbnail_path,
+    ])
+
+    preview_path = None
+    if preview_seconds > 0:
+        preview_path = os.path.join(output_dir, 'preview.mp4')
+        _run([
+            FFMPEG_PATH, '-y', '-v', 'error', '-i', video_path, '-t', str(preview_seconds), '-an',
+            '-vf', f'scale={THUMBNAIL_WIDTH}:-2', '-c:v', 'libx264', '-preset', 'veryfast',
+            '-pix_fmt', 'yuv420p', '-movflags', '+faststart', preview_path,
+        ])
+
+    manifest = {
+        'path': video_path,
+        'thumbnail': thumbnail_path,
+        'preview': preview_path,
+        'duration': round(duration) or None,
+        'width': info['width'],
+        'height': info['height'],
+    }
+    with open(os.path.join(output_dir, MANIFEST + '.part'), 'w') as f:
+        json.dump(manifest, f)
+    os.replace(os.path.join(output_dir, MANIFEST + '.part'), os.path.join(output_dir, MANIFEST))
+    return manifest
+
+class VideoProcessor:
+    """
+    Optional ffmpeg post-processing of downloaded videos.
+
+    Compresses videos above the target size, remuxes for streaming and
+    extracts a thumbnail and an animated preview. The work runs in a process
+    pool, and outputs are kept per task in `output_dir` so repeat deliveries
+    reuse them. Disabled unless VIDEO_PROCESSING is set and ffmpeg is found.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = VIDEO_PROCESSING,
+        output_dir: str = PROCESSED_VIDEO_DIR,
+        workers: int = VIDEO_PROCESSING_WORKERS,
+        target_size_mb: float = VIDEO_TARGET_SIZE_MB,
+        preview_seconds: float = VIDEO_PREVIEW_SECONDS,
+        ttl: int = PROCESSED_VIDEO_TTL,
+    ):
+        self.enabled = enabled and bool(shutil.which(FFMPEG_PATH)) and bool(shutil.which(FFPROBE_PATH))
+        if enabled and not self.enabled:
+            logger.warning("VIDEO_PROCESSING is set but ffmpeg/ffprobe were not found; sending videos as downloaded")
+        self.output_dir = output_dir
+        self.workers = workers
+        self.target_size = int(target_size_mb * 1024 ** 2)
+        self.preview_seconds = preview_seconds
+        self.ttl = ttl
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._running: Dict[str, asyncio.Future] = {}
+        self._last_eviction = 0.0
+
+    def _task_dir(self, task_id: str) -> str:
+        return os.path.join(self.output_dir, task_id)
+
+    def cached(self, task_id: str) -> Optional[Dict]:
+        """Outputs processed earlier for a task, if they are still on disk."""
+        if not self.enabled:
+            return None
+        try:
+            with open(os.path.join(self._task_dir(task_id), MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(manifest['path']):
+            return None
+        return manifest
+
+    async def process(self, task_id: str, source: str) -> Optional[Dict]:
+        """Process a downloaded video; None if processing is disabled or failed."""
+        if not self.enabled:
+            return None
+        cached = self.cached(task_id)
+        if cached:
+            return cached
+        # Deliveries of the same task share one processing job
+        job = self._running.get(task_id)
+        if job is None:
+            job = asyncio.ensure_future(self._process(task_id, source))
+            self._running[task_id] = job
+            job.add_done_callback(lambda _: self._running.pop(task_id, None))
+        return await asyncio.shield(job)
+
+    def discard_source(self, task_id: str, source: str) -> None:
+        """Remove a downloaded video, waiting for the task's processing job if one still reads it."""
+        def remove(_: object = None) -> None:
+            try:
+                os.remove(source)
+            except FileNotFoundError:
+                pass
+        job = self._running.get(task_id)
+        if job is not None and not job.done():
+            job.add_done_callback(remove)
+        else:
+            remove()
+
+    async def _process(self, task_id: str, source: str) -> Optional[Dict]:
+        self.evict_expired()
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        loop = asyncio.get_running_loop()
+        try:
+            with VIDEO_PROCESSING_LATENCY.time():
+                return await loop.run_in_executor(
+                    self._pool, process_video,
+                    source, self._task_dir(task_id), self.target_size, self.preview_seconds,
+                )
+        except Exception as e:
+            logger.error("Processing video of task %s failed, sending it as downloaded: %s", task_id, e)
+            shutil.rmtree(self._task_dir(task_id), ignore_errors=True)
+            return None
+
+    def evict_expired(self, force: bool = False) -> None:
+        """Remove outputs older than the TTL."""
+        now = time.time()
+        if not self.enabled or (not force and now - self._last_eviction < EVICTION_INTERVAL):
+            return
+        self._last_eviction = now
+        if not os.path.isdir(self.output_dir):
+            return
+        cutoff = now - self.ttl
+        for entry in os.scandir(self.output_dir):
+            if entry.is_dir() and entry.name not in self._running and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def stop(self) -> None:
+        """Shut the worker processes down, abandoning queued jobs."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None